@@ -1,29 +1,37 @@
-from flask import Flask, jsonify, request, url_for, Response
+from flask import Flask, Blueprint, current_app, jsonify, request, url_for, Response, make_response, g
 from flask_cors import CORS
 import services
 import os
-import map_renderer
+import config_generator
+import encoder_profiles
+import artifact_store
+import profiler
+import map_repository
+import change_detector
+import json
 import jwt
 from functools import wraps
 from datetime import datetime, timedelta
 import threading
+import time
 import uuid
+import zipfile
 from io import BytesIO
+from lazy_module import LazyModule
 
-app = Flask(__name__)
+# Pillow and NumPy are only needed by a few endpoints, so they are imported on first use
+# (or by the background pre-warm) instead of delaying every worker's startup.
+map_renderer = LazyModule('map_renderer')
+layout_engine = LazyModule('layout_engine')
 
-# --- Authentication Configuration ---
-# In a real production environment, this secret key should be loaded from a secure,
-# non-version-controlled location (e.g., environment variables, a vault).
-app.config['SECRET_KEY'] = 'your-super-secret-and-complex-key-that-is-not-in-git'
-# ---
+# Every endpoint lives on this blueprint; `create_app` builds the application around it.
+api = Blueprint('api', __name__)
 
-CORS(app)
-
-# Ensure the directories for storing maps, configs, and final outputs exist
-os.makedirs('static/maps', exist_ok=True)
-os.makedirs('static/configs', exist_ok=True)
-os.makedirs('static/final_maps', exist_ok=True)
+# --- Startup Configuration ---
+# Opt-in (AUTOCACTI_PREWARM=1 or the PREWARM config key): loads the render stack, icon
+# atlases and inventory in the background, starting with the worker's first request
+# (typically the load balancer's /health probe), i.e. once it is accepting connections.
+PREWARM_ENABLED = os.environ.get('AUTOCACTI_PREWARM', '0') == '1'
 
 
 # --- Authentication Token Decorator ---
@@ -44,18 +52,34 @@ def token_required(f):
 
         try:
             # Decode the token using the secret key
-            jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+            payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+            g.user = payload.get('user')
         except jwt.ExpiredSignatureError:
             return jsonify({'message': 'Token has expired!'}), 401
         except jwt.InvalidTokenError:
             return jsonify({'message': 'Token is invalid!'}), 401
-        
+
+        # `?profile=1` runs the handler under the sampling profiler; the profile is
+        # available at `/debug/profiles/<X-Profile-Id>` afterwards.
+        if _flag_requested(request.args.get('profile')):
+            if not profiler.PROFILING_ENABLED:
+                return jsonify({'error': 'Profiling is disabled on this server'}), 403
+            with profiler.profiled('request', f"{request.method} {request.path}") as profile_record:
+                response = make_response(f(*args, **kwargs))
+            response.headers['X-Profile-Id'] = profile_record['id']
+            return response
+
         return f(*args, **kwargs)
     return decorated
 
 
+def _flag_requested(value):
+    """True for the usual spellings of an enabled boolean query or form flag."""
+    return value is not None and value.lower() in ('1', 'true', 'yes', 'on')
+
+
 # --- Public Authentication Endpoint ---
-@app.route('/login', methods=['POST'])
+@api.route('/login', methods=['POST'])
 def login():
     """Authenticates a user and returns a JWT."""
     auth = request.json
@@ -71,7 +95,7 @@ def login():
         token = jwt.encode({
             'user': username,
             'exp': datetime.utcnow() + timedelta(hours=24) # Token expires in 24 hours
-        }, app.config['SECRET_KEY'], algorithm="HS256")
+        }, current_app.config['SECRET_KEY'], algorithm="HS256")
 
         return jsonify({'token': token})
 
@@ -79,7 +103,7 @@ def login():
 
 
 # --- Protected API Endpoints ---
-@app.route('/get-device-info/<ip_address>', methods=['GET'])
+@api.route('/get-device-info/<ip_address>', methods=['GET'])
 @token_required
 def get_device_info_endpoint(ip_address):
     """Retrieves device type, model, and hostname by IP address."""
@@ -88,71 +112,90 @@ def get_device_info_endpoint(ip_address):
         return jsonify(device_info)
     return jsonify({"error": "Device not found"}), 404
 
-@app.route('/get-device-neighbors/<ip_address>', methods=['GET'])
+@api.route('/get-device-neighbors/<ip_address>', methods=['GET'])
 @token_required
 def get_device_neighbors_endpoint(ip_address):
-    """Gets CDP neighbors of a device by IP address using SNMP."""
+    """
+    Gets CDP neighbors of a device by IP address using SNMP.
+
+    Optional query parameters:
+      - `interface`, `bandwidth`, `min_bandwidth`, `device_type`: server-side filters.
+      - `limit` and/or `cursor`: return one page plus a `next_cursor` for the next one.
+      - `format=ndjson` (or `Accept: application/x-ndjson`): stream one neighbor per line.
+    Without any of them the full list is returned as before.
+    """
+    filters = {key: request.args.get(key) for key in ('interface', 'bandwidth', 'min_bandwidth', 'device_type')
+               if request.args.get(key)}
+
+    if 'limit' in request.args or 'cursor' in request.args:
+        try:
+            page = services.get_device_neighbors_page(
+                ip_address, request.args.get('limit', services.NEIGHBOR_PAGE_SIZE), request.args.get('cursor'), filters
+            )
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 410
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if page is None:
+            return jsonify({"error": "Device not found or has no neighbors"}), 404
+        return jsonify(page)
+
     neighbors = services.get_device_neighbors(ip_address)
-    if neighbors:
-        return jsonify(neighbors)
-    return jsonify({"error": "Device not found or has no neighbors"}), 404
+    if not neighbors:
+        return jsonify({"error": "Device not found or has no neighbors"}), 404
+
+    try:
+        filtered = services.filter_neighbors(neighbors['neighbors'], **filters)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if request.args.get('format') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', ''):
+        def generate():
+            for neighbor in filtered:
+                yield json.dumps(neighbor) + '\n'
+        return Response(generate(), mimetype='application/x-ndjson', headers={'X-Total-Count': str(len(filtered))})
+
+    return jsonify({"neighbors": filtered})
     
-@app.route('/config-template', methods=['GET'])
+@api.route('/config-template', methods=['GET'])
 @token_required
 def get_config_template_endpoint():
     """Returns the Cacti Weathermap configuration template."""
-    template = """
-# Automatically generated by AutoCacti Map Creator
-
-BACKGROUND images/backgrounds/%name%.png
-WIDTH %width%
-HEIGHT %height%
-TITLE %name%
-
-KEYTEXTCOLOR 0 0 0
-KEYOUTLINECOLOR 0 0 0
-KEYBGCOLOR 255 255 255
-TITLECOLOR 0 0 0
-TIMECOLOR 0 0 0
-SCALE DEFAULT 0  0   192 192 192
-SCALE DEFAULT 0  1   255 255 255
-SCALE DEFAULT 1  10  140 0 255
-SCALE DEFAULT 10 25  32 32 255
-SCALE DEFAULT 25 40  0 192 255
-SCALE DEFAULT 40 55  0 240 0
-SCALE DEFAULT 55 70  240 240 0
-SCALE DEFAULT 70 85  255 192 0
-SCALE DEFAULT 85 100 255 0 0
-
-SET key_hidezero_DEFAULT 1
-
-# End of global section
-
-# TEMPLATE-only NODEs:
-# TEMPLATE-only LINKs:
-LINK DEFAULT
-    WIDTH 3
-    BWLABEL bits
-    BANDWIDTH 10000M
-
-# regular NODEs:
-%nodes%
-
-# regular LINKs:
-%links%
-
-# That's All Folks!
-""".strip()
+    template = config_generator.CONFIG_TEMPLATE
     return Response(template, mimetype='text/plain')
 
-@app.route('/groups', methods=['GET'])
+@api.route('/groups', methods=['GET'])
 @token_required
 def get_cacti_groups_endpoint():
     """Retrieves all registered Cacti installation groups."""
     groups = services.get_cacti_groups()
     return jsonify(groups)
 
-@app.route('/create-map', methods=['POST'])
+@api.route('/layout', methods=['POST'])
+@token_required
+def compute_layout_endpoint():
+    """
+    Computes node coordinates for a map graph on the server.
+    Pass `fixed` (a list of node IDs) to run an incremental layout that only
+    relaxes the other nodes around them.
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('nodes'), list):
+        return jsonify({"error": "A JSON body with a 'nodes' list is required"}), 400
+
+    edges = data.get('edges') or []
+    fixed = data.get('fixed')
+    if not isinstance(edges, list) or (fixed is not None and not isinstance(fixed, list)):
+        return jsonify({"error": "'edges' and 'fixed' must be lists"}), 400
+
+    try:
+        positions = layout_engine.compute_layout(data['nodes'], edges, fixed_node_ids=fixed)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"positions": positions})
+
+@api.route('/create-map', methods=['POST'])
 @token_required
 def create_map_endpoint():
     """
@@ -168,9 +211,10 @@ def create_map_endpoint():
     cacti_group_id = request.form.get('cacti_group_id')
     map_name = request.form.get('map_name')
     config_content = request.form.get('config_content')
+    map_document = request.form.get('map_document')
 
-    if not all([cacti_group_id, map_name, config_content]):
-        return jsonify({"error": "Missing required form data: cacti_group_id, map_name, or config_content"}), 400
+    if not all([cacti_group_id, map_name]) or not (config_content or map_document):
+        return jsonify({"error": "Missing required form data: cacti_group_id, map_name, and config_content or map_document"}), 400
 
     try:
         cacti_group_id = int(cacti_group_id)
@@ -181,6 +225,25 @@ def create_map_endpoint():
     if not installations:
         return jsonify({"error": f"Cacti group with ID {cacti_group_id} not found"}), 404
 
+    encoder_profile = request.form.get('encoder_profile') or services.get_group_encoder_profile(cacti_group_id)
+    if encoder_profile not in encoder_profiles.ENCODER_PROFILES:
+        return jsonify({"error": f"Unknown encoder_profile '{encoder_profile}'"}), 400
+
+    profile = _flag_requested(request.form.get('profile'))
+    if profile and not profiler.PROFILING_ENABLED:
+        return jsonify({"error": "Profiling is disabled on this server"}), 403
+
+    # A structured map document lets the server generate the config itself instead of
+    # patching and re-parsing the text produced by the browser.
+    generated_config = None
+    if map_document:
+        try:
+            generated_config = config_generator.regenerate_config(
+                map_name, json.loads(map_document), services.get_deployed_config_blocks(map_name)
+            )
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            return jsonify({"error": f"Invalid map_document: {e}"}), 400
+
     created_tasks = []
     
     for installation in installations:
@@ -199,7 +262,8 @@ def create_map_endpoint():
 
         thread = threading.Thread(
             target=services.process_map_task,
-            args=(task_id, thread_map_image, config_content, map_name)
+            args=(task_id, thread_map_image, config_content, map_name, generated_config,
+                  f"{installation['hostname']}/{map_name}", encoder_profile, profile)
         )
         thread.start()
 
@@ -208,12 +272,104 @@ def create_map_endpoint():
             "task_id": task_id
         })
 
-    return jsonify({
+    response = {
         "message": f"Map creation process has been started for {len(installations)} installations.",
         "tasks": created_tasks
+    }
+    if generated_config is not None:
+        delta = generated_config['delta']
+        response['config_changes'] = {kind: len(delta[kind]) for kind in ('added', 'changed', 'removed')}
+    return jsonify(response), 202
+
+@api.route('/bulk-maps', methods=['POST'])
+@token_required
+def create_bulk_maps_endpoint():
+    """
+    Accepts a zip archive of map configs (`<map name>.conf`) and their backgrounds for
+    a group of Cacti installations, and starts a single batch job that renders every
+    map once and deploys it to each installation. Returns the batch ID to poll.
+    """
+    if 'archive' not in request.files:
+        return jsonify({"error": "A zip archive is required"}), 400
+
+    cacti_group_id = request.form.get('cacti_group_id')
+    if not cacti_group_id:
+        return jsonify({"error": "Missing required form data: cacti_group_id"}), 400
+
+    try:
+        cacti_group_id = int(cacti_group_id)
+    except ValueError:
+        return jsonify({"error": "Invalid cacti_group_id format"}), 400
+
+    installations = services.get_installations_by_group_id(cacti_group_id)
+    if not installations:
+        return jsonify({"error": f"Cacti group with ID {cacti_group_id} not found"}), 404
+
+    encoder_profile = request.form.get('encoder_profile') or services.get_group_encoder_profile(cacti_group_id)
+    if encoder_profile not in encoder_profiles.ENCODER_PROFILES:
+        return jsonify({"error": f"Unknown encoder_profile '{encoder_profile}'"}), 400
+
+    # Spool the upload to disk so the batch thread can read entries after the request ends.
+    archive_path = artifact_store.temp_path('.zip')
+    request.files['archive'].save(archive_path)
+    if not zipfile.is_zipfile(archive_path):
+        os.remove(archive_path)
+        return jsonify({"error": "The archive is not a valid zip file"}), 400
+
+    batch_id = str(uuid.uuid4())
+    services.create_bulk_batch(batch_id, os.path.getsize(archive_path), encoder_profile)
+    thread = threading.Thread(
+        target=services.process_bulk_job,
+        args=(batch_id, archive_path, installations, encoder_profile)
+    )
+    thread.start()
+
+    return jsonify({
+        "message": f"Bulk map job has been started for {len(installations)} installations.",
+        "batch_id": batch_id
     }), 202
 
-@app.route('/task-status/<task_id>', methods=['GET'])
+@api.route('/bulk-maps/<batch_id>', methods=['GET'])
+@token_required
+def get_bulk_maps_status_endpoint(batch_id):
+    """Polls a bulk job for its aggregate progress, per-map manifest and throughput report."""
+    response = services.get_bulk_batch(batch_id)
+    if not response:
+        return jsonify({"error": "Batch not found"}), 404
+
+    for entry in response['maps']:
+        if entry.get('final_map_filename'):
+            entry['map_url'] = url_for('static', filename=entry['final_map_filename'], _external=True)
+        if entry.get('thumbnail_filename'):
+            entry['thumbnail_url'] = url_for('static', filename=entry['thumbnail_filename'], _external=True)
+    return jsonify(response)
+
+@api.route('/config-delta', methods=['POST'])
+@token_required
+def get_config_delta_endpoint():
+    """
+    Dry run: generates the config for an edited map document and returns only the
+    NODE/LINK blocks that differ from the config currently deployed for the map.
+    Nothing is stored, so a later /create-map reports the same changes.
+    """
+    data = request.get_json(silent=True)
+    if not data or not data.get('map_name') or not isinstance(data.get('map_document'), dict):
+        return jsonify({"error": "A JSON body with 'map_name' and 'map_document' is required"}), 400
+
+    try:
+        generated_config = config_generator.regenerate_config(
+            data['map_name'], data['map_document'], services.get_deployed_config_blocks(data['map_name'])
+        )
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        return jsonify({"error": f"Invalid map_document: {e}"}), 400
+
+    return jsonify({
+        "map_name": data['map_name'],
+        "block_count": len(generated_config['blocks']),
+        "delta": generated_config['delta']
+    })
+
+@api.route('/task-status/<task_id>', methods=['GET'])
 @token_required
 def get_task_status_endpoint(task_id):
     """Polls for the status of a background task."""
@@ -221,15 +377,154 @@ def get_task_status_endpoint(task_id):
     if not task:
         return jsonify({"error": "Task not found"}), 404
     
+    # Previews become available while the task is still processing
+    if task.get('preview_filename'):
+        task['preview_url'] = url_for('static', filename=task['preview_filename'], _external=True)
+        task['thumbnail_url'] = url_for('static', filename=task['thumbnail_filename'], _external=True)
+
+    if task.get('profile_id'):
+        task['profile_url'] = url_for('api.get_profile_endpoint', profile_id=task['profile_id'], _external=True)
+
     # If the task is successful, generate the final map URL dynamically
     if task['status'] == 'SUCCESS':
         final_map_filename = task.get('final_map_filename')
         if final_map_filename:
-            task['message'] = url_for('static', filename=f'final_maps/{final_map_filename}', _external=True)
+            task['message'] = url_for('static', filename=final_map_filename, _external=True)
 
     return jsonify(task)
 
-@app.route('/api/devices', methods=['POST'])
+@api.route('/maps', methods=['GET'])
+@token_required
+def list_deployed_maps_endpoint():
+    """
+    Lists the maps currently deployed to each installation. Each entry links to a
+    small thumbnail so map-list views never have to load the full-resolution PNG.
+    """
+    maps = []
+    for deployment_id, artifacts in artifact_store.list_owner_artifacts('deployment').items():
+        hostname, _, map_name = deployment_id.partition('/')
+        entry = {"installation": hostname, "map_name": map_name}
+        for kind, key in (('thumbnail', 'thumbnail_url'), ('preview', 'preview_url'), ('final_map', 'map_url')):
+            if kind in artifacts:
+                entry[key] = url_for('static', filename=artifacts[kind]['static_path'], _external=True)
+        if artifacts:
+            entry['deployed_at'] = datetime.utcfromtimestamp(
+                max(a['referenced_at'] for a in artifacts.values())
+            ).isoformat()
+        maps.append(entry)
+    return jsonify({"maps": maps})
+
+@api.route('/maps/<map_name>/revisions', methods=['POST'])
+@token_required
+def save_map_revision_endpoint(map_name):
+    """
+    Saves a map document (as exported by the editor) as the next revision of the map.
+    Optional `message` describes the change; optional `base_revision` (0 for a new map)
+    makes the save fail with 409 if someone else saved in the meantime.
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('document'), dict):
+        return jsonify({"error": "A JSON body with a 'document' object is required"}), 400
+
+    base_revision = data.get('base_revision')
+    if base_revision is not None and not isinstance(base_revision, int):
+        return jsonify({"error": "'base_revision' must be an integer"}), 400
+
+    try:
+        result = map_repository.save_revision(
+            map_name, data['document'], author=g.user, message=data.get('message'), base_revision=base_revision
+        )
+    except map_repository.RevisionConflict as e:
+        return jsonify({"error": str(e), "head": map_repository.get_head(map_name)}), 409
+    except ValueError as e:
+        return jsonify({"error": f"Invalid map document: {e}"}), 400
+
+    return jsonify(result), 201 if result['created'] else 200
+
+@api.route('/maps/<map_name>/revisions', methods=['GET'])
+@token_required
+def list_map_revisions_endpoint(map_name):
+    """Lists the saved revisions of a map, newest first."""
+    revisions = map_repository.list_revisions(map_name)
+    if revisions is None:
+        return jsonify({"error": f"Map '{map_name}' not found"}), 404
+    return jsonify({"map_name": map_name, "head": revisions[0]['revision'], "revisions": revisions})
+
+@api.route('/maps/<map_name>/revisions/<int:revision>', methods=['GET'])
+@token_required
+def get_map_revision_endpoint(map_name, revision):
+    """Returns the map document as it was at the given revision."""
+    try:
+        document = map_repository.checkout(map_name, revision)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify({"map_name": map_name, "revision": revision, "document": document})
+
+@api.route('/maps/<map_name>/diff', methods=['GET'])
+@token_required
+def diff_map_revisions_endpoint(map_name):
+    """
+    Returns the nodes, edges and document metadata that were added, changed or
+    removed between revisions `from` and `to` (default: the head).
+    """
+    try:
+        from_rev = int(request.args['from'])
+        to_rev = int(request.args.get('to') or map_repository.get_head(map_name) or 0)
+    except (KeyError, ValueError):
+        return jsonify({"error": "Query parameter 'from' (and optional 'to') must be revision numbers"}), 400
+
+    try:
+        diff = map_repository.diff_revisions(map_name, from_rev, to_rev)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify({"map_name": map_name, "from": from_rev, "to": to_rev, "diff": diff})
+
+@api.route('/topology/changes', methods=['GET'])
+@token_required
+def get_topology_changes_endpoint():
+    """Lists deployed maps whose devices' neighbors changed, plus polling statistics."""
+    return jsonify(change_detector.get_status())
+
+@api.route('/topology/devices', methods=['GET'])
+@token_required
+def get_topology_devices_endpoint():
+    """Returns the change-detection schedule and history of every watched device."""
+    return jsonify({"devices": change_detector.get_devices()})
+
+@api.route('/topology/stale-maps/<map_name>', methods=['DELETE'])
+@token_required
+def clear_stale_map_endpoint(map_name):
+    """Acknowledges a stale map, e.g. once it has been reviewed and redeployed."""
+    if not change_detector.clear_stale(map_name):
+        return jsonify({"error": f"Map '{map_name}' is not stale"}), 404
+    return jsonify({"message": f"Map '{map_name}' is no longer marked stale."})
+
+@api.route('/debug/profiles', methods=['GET'])
+@token_required
+def list_profiles_endpoint():
+    """Lists the stored request and task profiles, newest first."""
+    if not profiler.PROFILING_ENABLED:
+        return jsonify({"error": "Profiling is disabled on this server"}), 403
+    return jsonify({"profiles": profiler.list_profiles()})
+
+@api.route('/debug/profiles/<profile_id>', methods=['GET'])
+@token_required
+def get_profile_endpoint(profile_id):
+    """
+    Returns a captured profile as JSON, or with `?format=collapsed` as collapsed-stack
+    text that flamegraph.pl, speedscope and similar tools load directly.
+    """
+    if not profiler.PROFILING_ENABLED:
+        return jsonify({"error": "Profiling is disabled on this server"}), 403
+    profile = profiler.get_profile(profile_id)
+    if not profile:
+        return jsonify({"error": "Profile not found"}), 404
+
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.format_collapsed(profile), mimetype='text/plain')
+    return jsonify(profile)
+
+@api.route('/api/devices', methods=['POST'])
 @token_required
 def get_initial_device():
     """Endpoint to get the very first device to start the map."""
@@ -244,5 +539,96 @@ def get_initial_device():
         
     return jsonify(device)
 
+@api.route('/health', methods=['GET'])
+def health_endpoint():
+    """Unauthenticated readiness probe; answers as soon as the worker is serving."""
+    return jsonify({"status": "ok", "prewarm": dict(current_app.extensions['prewarm']['state'])})
+
+
+# --- Application Factory ---
+def _prewarm(state):
+    """Loads what the first requests would otherwise load on demand."""
+    state['status'] = 'running'
+    started = time.perf_counter()
+    try:
+        import node_renderer
+        map_renderer.load()
+        layout_engine.load()
+        services.render_farm.load()
+        for theme in node_renderer.ICONS_BY_THEME['Router']:
+            node_renderer.get_sprite_atlas(node_renderer.ICON_SIZE, theme)
+        services.get_cacti_groups()
+        # Reads every deployed config once, which also seeds change detection.
+        services.get_deployed_map_devices()
+        state['status'] = 'complete'
+    except Exception as e:
+        print(f"Pre-warm failed: {e}")
+        state['status'] = 'failed'
+    state['seconds'] = round(time.perf_counter() - started, 3)
+
+
+def _start_prewarm():
+    """Runs before every request; starts the app's pre-warm on the first one."""
+    prewarm = current_app.extensions['prewarm']
+    if prewarm['state']['status'] != 'pending':
+        return
+    with prewarm['lock']:
+        if prewarm['state']['status'] == 'pending':
+            prewarm['state']['status'] = 'scheduled'
+            threading.Thread(target=_prewarm, args=(prewarm['state'],), daemon=True).start()
+
+
+def create_app(config=None):
+    """
+    Builds the Flask application. Directory setup, the artifact GC thread, change
+    detection and the optional pre-warm all start here rather than at import time, so
+    importing this module has no side effects and stays fast. The background threads
+    are process-wide and start only once, however many apps are created.
+    For WSGI servers, `wsgi.py` exposes an app built by this factory.
+    """
+    app = Flask(__name__)
+
+    # --- Authentication Configuration ---
+    # In a real production environment, this secret key should be loaded from a secure,
+    # non-version-controlled location (e.g., environment variables, a vault).
+    app.config['SECRET_KEY'] = 'your-super-secret-and-complex-key-that-is-not-in-git'
+    # ---
+    if config:
+        app.config.update(config)
+
+    # The frontend reads these response headers, so they must be exposed to it.
+    CORS(app, expose_headers=['X-Profile-Id', 'X-Total-Count'])
+    app.register_blueprint(api)
+
+    # Ensure the sharded artifact store for maps, configs, and final outputs exists,
+    # move in anything still in the flat pre-store directories, and keep it bounded
+    # by periodically collecting unreferenced artifacts.
+    artifact_store.init_store()
+    artifact_store.import_legacy_files()
+    artifact_store.start_gc_thread()
+    # Versioned map documents saved from the editor.
+    map_repository.init_repository()
+    # Device schedules, stale flags and the neighbor sets recorded at deployment.
+    change_detector.init_store()
+
+    # Re-poll the devices on deployed maps and flag maps whose topology changed. Every
+    # worker starts a scheduler thread, but only the one holding the lease in the
+    # topology store polls. With CHANGE_DETECTION_RERENDER=1, stale maps are also
+    # re-rendered without dead links.
+    if os.environ.get('CHANGE_DETECTION_ENABLED', '1') != '0':
+        if os.environ.get('CHANGE_DETECTION_RERENDER', '0') == '1':
+            change_detector.register_stale_hook(services.rerender_stale_map)
+        change_detector.start(services.get_device_neighbors, services.get_deployed_map_devices)
+
+    app.config.setdefault('PREWARM', PREWARM_ENABLED)
+    app.extensions['prewarm'] = {
+        'state': {'status': 'pending' if app.config['PREWARM'] else 'disabled', 'seconds': None},
+        'lock': threading.Lock(),
+    }
+    app.before_request(_start_prewarm)
+
+    return app
+
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    create_app().run(debug=True, port=5000)
\ No newline at end of file
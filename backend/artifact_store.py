@@ -0,0 +1,382 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# --- Artifact Store Configuration ---
+# Artifacts live under Flask's static folder so they can be served directly. Files are
+# content-addressed and sharded by hash prefix (`ab/cd/abcd...png`), which keeps every
+# directory small no matter how many maps have been rendered.
+STATIC_ROOT = 'static'
+ARTIFACT_DIR = 'artifacts'
+ARTIFACT_ROOT = os.path.join(STATIC_ROOT, ARTIFACT_DIR)
+# The index must not be publicly served, so it lives in Flask's instance folder.
+INDEX_PATH = os.path.join('instance', 'artifacts.sqlite3')
+# Scratch files (renders in progress, spooled uploads) must not be served either. They
+# are moved into the store with a rename, so this must be on the same file system.
+SCRATCH_ROOT = os.path.join('instance', 'artifact-scratch')
+# The flat directories (under STATIC_ROOT) that maps were written to before the store
+# existed, and the kind their files are imported as.
+LEGACY_DIRS = {'maps': 'background', 'configs': 'config', 'final_maps': 'final_map'}
+
+# Unreferenced artifacts younger than this are kept, which protects files that were
+# just written by a task that has not registered its reference yet.
+UNREFERENCED_GRACE_SECONDS = 60 * 60
+# References held by tasks expire after this long; deployment references never expire
+# but are replaced whenever a map is deployed to the same installation again.
+TASK_REF_RETENTION_SECONDS = 7 * 24 * 60 * 60
+GC_INTERVAL_SECONDS = 60 * 60
+GC_BATCH_SIZE = 500
+
+_lock = threading.Lock()
+_gc_thread = None
+
+
+@contextmanager
+def _connect(immediate=False):
+    """
+    Opens the index, commits on success, and always closes the connection. With
+    `immediate`, the write lock is taken up front, which serializes the transaction
+    with every other process using the store (`_lock` only covers this one).
+    """
+    conn = sqlite3.connect(INDEX_PATH, timeout=30)
+    try:
+        with conn:
+            if immediate:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+    finally:
+        conn.close()
+
+
+def init_store():
+    """Creates the artifact root and the SQLite index if they do not exist yet."""
+    os.makedirs(ARTIFACT_ROOT, exist_ok=True)
+    os.makedirs(SCRATCH_ROOT, exist_ok=True)
+    os.makedirs(os.path.dirname(INDEX_PATH), exist_ok=True)
+    with _lock, _connect() as conn:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS artifacts (
+                hash TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS refs (
+                hash TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                owner_type TEXT NOT NULL,
+                owner_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (hash, kind, owner_type, owner_id)
+            );
+            CREATE INDEX IF NOT EXISTS refs_by_owner ON refs (owner_type, owner_id);
+            CREATE INDEX IF NOT EXISTS refs_by_hash ON refs (hash);
+        """)
+
+
+def _relative_path(digest, extension):
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def temp_path(extension=''):
+    """Returns a scratch path on the same file system as the store, for use with `put_file`."""
+    return os.path.join(SCRATCH_ROOT, f"{uuid.uuid4()}{extension}")
+
+
+def _commit(digest, extension, kind, size, source_path):
+    """
+    Moves `source_path` into its shard, or drops it if the artifact is already stored.
+    The existence check and the index update share one immediate transaction, and
+    `collect_garbage` deletes under the same lock, so another process cannot delete
+    the file in between. Refreshing `last_used_at` then keeps it for the grace
+    period, until the caller has added its references.
+    """
+    relative = _relative_path(digest, extension)
+    final_path = os.path.join(ARTIFACT_ROOT, relative)
+    now = time.time()
+
+    with _lock, _connect(immediate=True) as conn:
+        row = conn.execute("SELECT path FROM artifacts WHERE hash = ?", (digest,)).fetchone()
+        if row and os.path.exists(os.path.join(ARTIFACT_ROOT, row[0])):
+            os.remove(source_path)
+            relative = row[0]
+            conn.execute("UPDATE artifacts SET last_used_at = ? WHERE hash = ?", (now, digest))
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(source_path, final_path)
+            conn.execute(
+                "INSERT OR REPLACE INTO artifacts (hash, path, kind, size, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, relative, kind, size, now, now)
+            )
+
+    return {
+        'hash': digest,
+        'path': os.path.join(ARTIFACT_ROOT, relative),
+        'relative_path': relative,
+        # Relative to the static folder, suitable for `url_for('static', filename=...)`.
+        'static_path': f"{ARTIFACT_DIR}/{relative}",
+        'size': size,
+        'kind': kind,
+    }
+
+
+def put_bytes(data, extension, kind):
+    """Stores `data` (bytes) and returns its artifact record. Identical content is stored once."""
+    digest = hashlib.sha256(data).hexdigest()
+    scratch = temp_path(extension)
+    with open(scratch, 'wb') as f:
+        f.write(data)
+    return _commit(digest, extension, kind, len(data), scratch)
+
+
+def put_file(source_path, extension, kind):
+    """Moves an already written file into the store and returns its artifact record."""
+    sha = hashlib.sha256()
+    with open(source_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return _commit(sha.hexdigest(), extension, kind, os.path.getsize(source_path), source_path)
+
+
+def put_stream(stream, extension, kind, max_bytes=None):
+    """
+    Copies a readable binary stream (e.g. an archive entry) into the store in chunks,
+    hashing as it goes, so large files never have to be held in memory.
+    Raises ValueError if the stream is longer than `max_bytes`.
+    """
+    sha = hashlib.sha256()
+    size = 0
+    scratch = temp_path(extension)
+    try:
+        with open(scratch, 'wb') as f:
+            for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise ValueError(f"stream exceeds {max_bytes} bytes")
+                sha.update(chunk)
+                f.write(chunk)
+    except Exception:
+        os.remove(scratch)
+        raise
+    return _commit(sha.hexdigest(), extension, kind, size, scratch)
+
+
+def reference_from_artifact(artifact):
+    """
+    Path to `artifact` relative to the directory of any other artifact, e.g. for a
+    config's BACKGROUND line. Every shard sits at the same depth, so this does not
+    depend on where the referring artifact ends up.
+    """
+    return f"../../{artifact['relative_path']}"
+
+
+def _ref_rows(owner_type, owner_id, artifacts, now):
+    return [(artifact['hash'], artifact['kind'], owner_type, owner_id, now) for artifact in artifacts]
+
+
+def add_refs(owner_type, owner_id, artifacts):
+    """
+    Records that `owner_type`/`owner_id` (e.g. a task or deployment) uses the given
+    artifact records. References keep the kind each artifact is used as, since
+    identical bytes can be stored under several kinds (e.g. a tiny background makes
+    the preview and the thumbnail the same file).
+    """
+    now = time.time()
+    with _lock, _connect() as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO refs (hash, kind, owner_type, owner_id, created_at) VALUES (?, ?, ?, ?, ?)",
+            _ref_rows(owner_type, owner_id, artifacts, now)
+        )
+
+
+def replace_refs(owner_type, owner_id, artifacts):
+    """Atomically swaps the artifacts held by an owner, releasing the previous ones."""
+    now = time.time()
+    with _lock, _connect() as conn:
+        conn.execute("DELETE FROM refs WHERE owner_type = ? AND owner_id = ?", (owner_type, owner_id))
+        conn.executemany(
+            "INSERT OR IGNORE INTO refs (hash, kind, owner_type, owner_id, created_at) VALUES (?, ?, ?, ?, ?)",
+            _ref_rows(owner_type, owner_id, artifacts, now)
+        )
+
+
+def release_refs(owner_type, owner_id):
+    """Drops every reference held by an owner; its artifacts become eligible for GC."""
+    with _lock, _connect() as conn:
+        conn.execute("DELETE FROM refs WHERE owner_type = ? AND owner_id = ?", (owner_type, owner_id))
+
+
+def _owned_record(kind, digest, relative, size, referenced_at):
+    return {
+        'hash': digest,
+        'path': os.path.join(ARTIFACT_ROOT, relative),
+        'relative_path': relative,
+        'static_path': f"{ARTIFACT_DIR}/{relative}",
+        'size': size,
+        'kind': kind,
+        'referenced_at': referenced_at,
+    }
+
+
+def list_owner_artifacts(owner_type):
+    """
+    Returns `{owner_id: {kind: artifact}}` for every owner of the given type, e.g. to
+    list deployments with their thumbnails without touching any image files.
+    """
+    with _lock, _connect() as conn:
+        rows = conn.execute(
+            "SELECT r.owner_id, r.kind, a.hash, a.path, a.size, r.created_at FROM refs r "
+            "JOIN artifacts a ON a.hash = r.hash WHERE r.owner_type = ? ORDER BY r.owner_id",
+            (owner_type,)
+        ).fetchall()
+
+    owners = {}
+    for owner_id, kind, digest, relative, size, created_at in rows:
+        owners.setdefault(owner_id, {})[kind] = _owned_record(kind, digest, relative, size, created_at)
+    return owners
+
+
+def latest_owner_artifact(owner_type, kind, owner_suffix=''):
+    """
+    Returns the most recently referenced artifact of `kind` held by an owner of the
+    given type whose ID ends with `owner_suffix`, or None. Unlike
+    `list_owner_artifacts`, only that one row is read.
+    """
+    pattern = '%' + re.sub(r'([\\%_])', r'\\\1', owner_suffix)
+    with _lock, _connect() as conn:
+        row = conn.execute(
+            "SELECT a.hash, a.path, a.size, r.created_at FROM refs r JOIN artifacts a ON a.hash = r.hash "
+            "WHERE r.owner_type = ? AND r.kind = ? AND r.owner_id LIKE ? ESCAPE '\\' "
+            "ORDER BY r.created_at DESC LIMIT 1",
+            (owner_type, kind, pattern)
+        ).fetchone()
+    return _owned_record(kind, *row) if row else None
+
+
+def collect_garbage(now=None):
+    """
+    Expires old task references and deletes artifacts that are no longer referenced
+    and are past the grace period. Returns a summary dict.
+    """
+    now = time.time() if now is None else now
+    removed_files = 0
+    freed_bytes = 0
+
+    with _lock, _connect() as conn:
+        expired_refs = conn.execute(
+            "DELETE FROM refs WHERE owner_type = 'task' AND created_at < ?",
+            (now - TASK_REF_RETENTION_SECONDS,)
+        ).rowcount
+
+    while True:
+        # The files are unlinked inside the transaction, so a concurrent `_commit` sees
+        # either the artifact with its file or neither.
+        with _lock, _connect(immediate=True) as conn:
+            rows = conn.execute(
+                "SELECT hash, path, size FROM artifacts a WHERE last_used_at < ? "
+                "AND NOT EXISTS (SELECT 1 FROM refs r WHERE r.hash = a.hash) LIMIT ?",
+                (now - UNREFERENCED_GRACE_SECONDS, GC_BATCH_SIZE)
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany("DELETE FROM artifacts WHERE hash = ?", [(row[0],) for row in rows])
+
+            for _, relative, size in rows:
+                path = os.path.join(ARTIFACT_ROOT, relative)
+                try:
+                    os.remove(path)
+                    removed_files += 1
+                    freed_bytes += size
+                    shard = os.path.dirname(path)
+                    os.rmdir(shard)
+                    os.rmdir(os.path.dirname(shard))
+                except OSError:
+                    # Missing file or non-empty shard directory; both are fine.
+                    pass
+
+    # Scratch files left behind by renders that crashed before reaching `put_file`.
+    for entry in os.scandir(SCRATCH_ROOT):
+        try:
+            if entry.stat().st_mtime < now - UNREFERENCED_GRACE_SECONDS:
+                os.remove(entry.path)
+                removed_files += 1
+        except OSError:
+            pass
+
+    return {'expired_refs': expired_refs, 'removed_files': removed_files, 'freed_bytes': freed_bytes}
+
+
+def import_legacy_files():
+    """
+    One-off import of the flat LEGACY_DIRS. Files are grouped into maps by their
+    `<map name>_<uuid>` stem; each config's BACKGROUND is pointed at the stored
+    background, and every map is referenced by a `legacy` owner so GC keeps it.
+    Imported files are removed, and so are the directories once empty, so later
+    calls find nothing to do. Returns the number of maps imported.
+    """
+    maps = {}
+    for directory, kind in LEGACY_DIRS.items():
+        path = os.path.join(STATIC_ROOT, directory)
+        if not os.path.isdir(path):
+            continue
+        for entry in os.scandir(path):
+            if entry.is_file():
+                stem, extension = os.path.splitext(entry.name)
+                maps.setdefault(stem, {})[kind] = (entry.path, extension)
+
+    for stem, files in maps.items():
+        artifacts = []
+        background = None
+        if 'background' in files:
+            background = put_file(*files['background'], 'background')
+            artifacts.append(background)
+        if 'config' in files:
+            config_path, extension = files['config']
+            with open(config_path, encoding='utf-8') as f:
+                config_content = f.read()
+            if background is not None:
+                config_content = re.sub(r'^(BACKGROUND\s+).*$', lambda m: m.group(1) + reference_from_artifact(background),
+                                        config_content, flags=re.MULTILINE)
+            artifacts.append(put_bytes(config_content.encode('utf-8'), extension, 'config'))
+            os.remove(config_path)
+        if 'final_map' in files:
+            artifacts.append(put_file(*files['final_map'], 'final_map'))
+        add_refs('legacy', stem, artifacts)
+
+    for directory in LEGACY_DIRS:
+        try:
+            os.rmdir(os.path.join(STATIC_ROOT, directory))
+        except OSError:
+            # Missing, or holding something that was not imported; both are left alone.
+            pass
+    if maps:
+        print(f"Imported {len(maps)} legacy maps into the artifact store")
+    return len(maps)
+
+
+def _gc_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            summary = collect_garbage()
+            if summary['removed_files'] or summary['expired_refs']:
+                print(f"Artifact GC: {summary}")
+        except Exception as e:
+            print(f"Artifact GC failed: {e}")
+
+
+def start_gc_thread(interval=GC_INTERVAL_SECONDS):
+    """Starts the periodic garbage collector in a daemon thread (once per process)."""
+    global _gc_thread
+    if _gc_thread is None:
+        _gc_thread = threading.Thread(target=_gc_loop, args=(interval,), daemon=True)
+        _gc_thread.start()
+    return _gc_thread
@@ -0,0 +1,67 @@
+"""
+Compares encode time and output size of the map encoder profiles on synthetic maps
+that look like real exports: a flat light or dark background, device boxes, labels
+and a few hundred colored links.
+
+Run from the backend directory:
+    python benchmarks/bench_encoders.py
+"""
+import os
+import random
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+import map_renderer  # noqa: E402
+
+MAPS = [
+    ('light 1920x1080, 100 devices', (1920, 1080), '#ffffff', '#222222', 100),
+    ('dark 1920x1080, 100 devices', (1920, 1080), '#18191a', '#e4e6eb', 100),
+    ('light 4000x3000, 600 devices', (4000, 3000), '#ffffff', '#222222', 600),
+    ('dark 8000x6000, 2000 devices', (8000, 6000), '#18191a', '#e4e6eb', 2000),
+]
+REPEATS = 3
+
+
+def build_map(size, background, foreground, device_count, seed=0):
+    """Draws a representative rendered map as an RGBA image."""
+    rng = random.Random(seed)
+    image = Image.new('RGBA', size, background)
+    draw = ImageDraw.Draw(image)
+    width, height = size
+
+    centres = [(rng.randrange(80, width - 80), rng.randrange(80, height - 80)) for _ in range(device_count)]
+    map_data = {'nodes': {}, 'links': []}
+    for i, (x, y) in enumerate(centres):
+        map_data['nodes'][str(i)] = {'x': x, 'y': y}
+        if i:
+            map_data['links'].append({'node1': str(rng.randrange(i)), 'node2': str(i)})
+
+    map_renderer._draw_links(draw, map_data)
+    for i, (x, y) in enumerate(centres):
+        draw.rectangle([x - 24, y - 24, x + 24, y + 24], outline=foreground, width=2)
+        draw.text((x - 30, y + 30), f"Access-SW-{i}", fill=foreground)
+    return image
+
+
+def main():
+    print(f"{'map':<32} {'profile':<14} {'encode (ms)':>12} {'size (KiB)':>11}")
+    for label, size, background, foreground, device_count in MAPS:
+        image = build_map(size, background, foreground, device_count)
+        for profile_name in map_renderer.ENCODER_PROFILES:
+            best = None
+            for _ in range(REPEATS):
+                output = BytesIO()
+                start = time.perf_counter()
+                map_renderer.encode_image(image, output, profile_name)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{label:<32} {profile_name:<14} {best * 1000:>12.1f} {output.tell() / 1024:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmarks the server-side layout engine on synthetic campus-style topologies.
+
+Run from the backend directory:
+    python benchmarks/bench_layout.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import layout_engine  # noqa: E402
+
+SIZES = [100, 500, 1000, 2000, 5000]
+NEW_NODES_PER_INCREMENT = 50
+
+
+def build_topology(node_count, seed=0):
+    """Creates a core / distribution / access tree with some redundant uplinks."""
+    rng = random.Random(seed)
+    nodes, edges = [], []
+
+    def add_node(node_id, icon_type):
+        nodes.append({'id': node_id, 'type': 'custom', 'position': None, 'data': {'iconType': icon_type}})
+
+    core_count = max(2, node_count // 500)
+    dist_count = max(2, node_count // 25)
+    for i in range(core_count):
+        add_node(f'core-{i}', 'Router')
+    for i in range(dist_count):
+        add_node(f'dist-{i}', 'Switch')
+        edges.append({'source': f'core-{i % core_count}', 'target': f'dist-{i}'})
+        edges.append({'source': f'core-{(i + 1) % core_count}', 'target': f'dist-{i}'})
+    for i in range(node_count - core_count - dist_count):
+        add_node(f'access-{i}', 'Switch')
+        edges.append({'source': f'dist-{rng.randrange(dist_count)}', 'target': f'access-{i}'})
+    return nodes, edges
+
+
+def mean_edge_length(positions, edges):
+    total = 0.0
+    for edge in edges:
+        a, b = positions[edge['source']], positions[edge['target']]
+        total += ((a['x'] - b['x']) ** 2 + (a['y'] - b['y']) ** 2) ** 0.5
+    return total / len(edges)
+
+
+def main():
+    print(f"{'nodes':>6} {'edges':>6} {'full (s)':>9} {'incr (s)':>9} {'edge len / k':>13}")
+    for size in SIZES:
+        nodes, edges = build_topology(size)
+
+        start = time.perf_counter()
+        positions = layout_engine.compute_layout(nodes, edges)
+        full_seconds = time.perf_counter() - start
+
+        # Incremental: keep the laid-out map fixed and attach new access switches to it.
+        placed_nodes = [dict(n, position=positions[n['id']]) for n in nodes]
+        fixed = [n['id'] for n in nodes]
+        new_edges = list(edges)
+        for i in range(NEW_NODES_PER_INCREMENT):
+            placed_nodes.append({'id': f'new-{i}', 'type': 'custom', 'data': {'iconType': 'Switch'}})
+            new_edges.append({'source': f'dist-{i % 2}', 'target': f'new-{i}'})
+
+        start = time.perf_counter()
+        layout_engine.compute_layout(placed_nodes, new_edges, fixed_node_ids=fixed)
+        incremental_seconds = time.perf_counter() - start
+
+        ratio = mean_edge_length(positions, edges) / layout_engine.NODE_SPACING
+        print(f"{size:>6} {len(edges):>6} {full_seconds:>9.3f} {incremental_seconds:>9.3f} {ratio:>13.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Measures storage per revision, save latency, checkout latency and diff latency of the
+map repository for a long series of small edits to a large map, and checks that every
+revision checks out to exactly the document that was saved.
+
+Run from the backend directory:
+    python benchmarks/bench_map_repository.py [nodes] [edits]
+"""
+import copy
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import map_repository  # noqa: E402
+
+
+def build_document(node_count, rng):
+    """A map document shaped like the editor's JSON export."""
+    nodes = [{
+        'id': f"10.{i // 65536}.{i // 256 % 256}.{i % 256}",
+        'type': 'custom',
+        'position': {'x': rng.uniform(0, 8000), 'y': rng.uniform(0, 6000)},
+        'data': {'hostname': f"Access-SW-{i}", 'ip': f"10.{i // 65536}.{i // 256 % 256}.{i % 256}",
+                 'iconType': 'Switch', 'model': 'Cisco C9300'},
+    } for i in range(node_count)]
+    edges = []
+    for i in range(1, node_count):
+        source, target = nodes[rng.randrange(i)]['id'], nodes[i]['id']
+        edges.append({'id': f"e-{source}-{target}-Gi1-0-{i}", 'source': source, 'target': target,
+                      'data': {'interface': f"GigabitEthernet1/0/{i % 48}", 'bandwidth': '1G'}})
+    return {'version': '1.0.0', 'createdAt': '2025-01-01T00:00:00Z', 'mapName': 'bench',
+            'nodes': nodes, 'edges': edges}
+
+
+def edit(document, rng, step):
+    """A typical editor save: a few nodes dragged, sometimes a link added or removed."""
+    document = copy.deepcopy(document)
+    for node in rng.sample(document['nodes'], rng.randint(1, 5)):
+        node['position'] = {'x': node['position']['x'] + rng.uniform(-50, 50),
+                            'y': node['position']['y'] + rng.uniform(-50, 50)}
+    if step % 7 == 0:
+        source, target = rng.sample(document['nodes'], 2)
+        document['edges'].append({'id': f"e-extra-{step}", 'source': source['id'], 'target': target['id'],
+                                  'data': {'interface': 'TenGigabitEthernet1/1', 'bandwidth': '10G'}})
+    if step % 11 == 0:
+        document['edges'].pop(rng.randrange(len(document['edges'])))
+    document['createdAt'] = f"2025-01-01T00:{step // 60 % 60:02d}:{step % 60:02d}Z"
+    return document
+
+
+def main():
+    node_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    edit_count = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        map_repository.INDEX_PATH = os.path.join(directory, 'maps.sqlite3')
+        map_repository.init_repository()
+
+        documents = [build_document(node_count, rng)]
+        for step in range(1, edit_count):
+            documents.append(edit(documents[-1], rng, step))
+        full_bytes = len(json.dumps(documents[-1]).encode('utf-8'))
+
+        save_times, stored = [], []
+        for document in documents:
+            start = time.perf_counter()
+            result = map_repository.save_revision('bench', document)
+            save_times.append(time.perf_counter() - start)
+            stored.append(result['stored_bytes'])
+
+        # Cold checkouts, so every one replays from its snapshot.
+        checkout_times = []
+        for rev, document in enumerate(documents, start=1):
+            map_repository._document_cache.clear()
+            start = time.perf_counter()
+            checked_out = map_repository.checkout('bench', rev)
+            checkout_times.append(time.perf_counter() - start)
+            assert checked_out == document, f"revision {rev} does not round-trip"
+
+        start = time.perf_counter()
+        diff = map_repository.diff_revisions('bench', 1, len(documents))
+        diff_time = time.perf_counter() - start
+
+        deltas = [size for rev, size in enumerate(stored, start=1)
+                  if (rev - 1) % map_repository.SNAPSHOT_INTERVAL]
+        print(f"{node_count} nodes, {edit_count} revisions, document {full_bytes / 1024:.0f} KiB as JSON")
+        print(f"total stored        {sum(stored) / 1024:>9.1f} KiB "
+              f"(vs {full_bytes * edit_count / 1024 / 1024:.1f} MiB as full documents)")
+        print(f"delta revision      {sum(deltas) / len(deltas) / 1024:>9.2f} KiB average")
+        print(f"snapshot revision   {max(stored) / 1024:>9.1f} KiB")
+        print(f"save                {sum(save_times) / len(save_times) * 1000:>9.1f} ms average")
+        print(f"checkout (cold)     {sum(checkout_times) / len(checkout_times) * 1000:>9.1f} ms average, "
+              f"{max(checkout_times) * 1000:.1f} ms worst")
+        print(f"diff 1..{len(documents):<11} {diff_time * 1000:>9.1f} ms "
+              f"({len(diff['nodes']['changed'])} nodes changed, {len(diff['edges']['added'])} edges added)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Measures render throughput of the thread backend against the process render farm
+for a batch of renders that share one background, as a group upload does.
+
+Run from the backend directory:
+    python benchmarks/bench_render_farm.py [jobs]
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PIL import Image  # noqa: E402
+
+import render_farm  # noqa: E402
+
+BACKGROUND_SIZE = (4000, 3000)
+LINK_COUNT = 1500
+ENCODER_PROFILE = 'png-fast'
+
+
+def write_fixture(directory):
+    background_path = os.path.join(directory, 'background.png')
+    Image.new('RGB', BACKGROUND_SIZE, '#ffffff').save(background_path)
+    width, height = BACKGROUND_SIZE
+    map_data = {'nodes': {}, 'links': [], 'background': 'background.png'}
+    for i in range(LINK_COUNT + 1):
+        map_data['nodes'][str(i)] = {'x': (i * 97) % width, 'y': (i * 61) % height}
+        if i:
+            map_data['links'].append({'node1': str(i - 1), 'node2': str(i)})
+    return background_path, os.path.join(directory, 'map.conf'), map_data
+
+
+def run_batch(jobs, workers, background_path, config_path, map_data, directory):
+    def render(i):
+        return render_farm.render_map('bench', background_path, config_path,
+                                      os.path.join(directory, f'out-{i}.png'), map_data, ENCODER_PROFILE)
+
+    start = time.perf_counter()
+    # Hold the shared background for the whole batch, as concurrent group tasks do.
+    if render_farm.RENDER_BACKEND == 'process':
+        render_farm.acquire_background('bench', background_path)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(render, range(jobs)))
+    finally:
+        if render_farm.RENDER_BACKEND == 'process':
+            render_farm.release_background('bench')
+    return time.perf_counter() - start
+
+
+def main():
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    cores = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, 4, 8, 16, 32, cores} & set(range(1, cores + 1)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        fixture = write_fixture(directory)
+        print(f"{jobs} renders of a {BACKGROUND_SIZE[0]}x{BACKGROUND_SIZE[1]} map, {cores} cores")
+        print(f"{'backend':<8} {'workers':>7} {'seconds':>8} {'renders/s':>10} {'speedup':>8}")
+
+        render_farm.RENDER_BACKEND = 'thread'
+        baseline = run_batch(jobs, cores, *fixture, directory)
+        print(f"{'thread':<8} {cores:>7} {baseline:>8.2f} {jobs / baseline:>10.2f} {1.0:>8.2f}")
+
+        render_farm.RENDER_BACKEND = 'process'
+        for workers in worker_counts:
+            render_farm._pool = None
+            render_farm.RENDER_WORKERS = workers
+            run_batch(workers, workers, *fixture, directory)  # start and warm the workers
+            seconds = run_batch(jobs, workers, *fixture, directory)
+            render_farm._get_pool().shutdown()
+            print(f"{'process':<8} {workers:>7} {seconds:>8.2f} {jobs / seconds:>10.2f} {baseline / seconds:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
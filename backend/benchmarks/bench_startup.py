@@ -0,0 +1,139 @@
+"""
+Measures how quickly a fresh backend worker becomes ready: the time to import `app`,
+the time `create_app()` takes, and the time from spawning the process to the first
+successful response from `/health`, with the background pre-warm enabled and disabled.
+Every sample runs in a new interpreter (so nothing is already imported) inside a
+scratch directory, and the slowest direct imports of `app` are listed at the end.
+
+Run from the backend directory:
+    python benchmarks/bench_startup.py [runs]
+"""
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+READY_TIMEOUT_SECONDS = 30
+SLOWEST_IMPORTS = 10
+
+IMPORT_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': created - imported}))
+"""
+
+SERVE_SCRIPT = """
+import sys
+from app import create_app
+create_app().run(port=int(sys.argv[1]), use_reloader=False)
+"""
+
+
+def _environment(prewarm):
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(BACKEND_DIR), AUTOCACTI_PREWARM='1' if prewarm else '0')
+    # Polling the mock devices is not part of starting up.
+    env['CHANGE_DETECTION_ENABLED'] = '0'
+    return env
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(cwd, prewarm):
+    output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT], cwd=cwd, env=_environment(prewarm),
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_first_response(cwd, prewarm):
+    """Seconds from spawning the server to the first 200 from /health, and its final body."""
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-c', SERVE_SCRIPT, str(port)], cwd=cwd,
+                              env=_environment(prewarm), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < READY_TIMEOUT_SECONDS:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        ready = time.perf_counter() - started
+                        break
+            except OSError:
+                time.sleep(0.005)
+        else:
+            raise RuntimeError(f"The server did not answer within {READY_TIMEOUT_SECONDS}s")
+
+        body = None
+        if prewarm:
+            # Wait for the pre-warm too, to report how long the background work takes.
+            while time.perf_counter() - started < READY_TIMEOUT_SECONDS:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    body = json.loads(response.read())
+                if body['prewarm']['status'] in ('complete', 'failed'):
+                    break
+                time.sleep(0.05)
+        return ready, body
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def slowest_imports(cwd):
+    """The modules `app` imports directly, by cumulative import time (slowest first)."""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=cwd,
+                            env=_environment(False), capture_output=True, text=True, check=True).stderr
+    # Each module is reported after everything it imported, indented by two spaces per
+    # level, so the direct imports of `app` are the level-1 entries just before it.
+    children = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == 'app':
+                break
+            children = []
+        elif depth == 1:
+            children.append((int(cumulative), name.strip()))
+    return sorted(children, reverse=True)[:SLOWEST_IMPORTS]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    with tempfile.TemporaryDirectory() as cwd:
+        print(f"median of {runs} fresh processes each")
+        for prewarm in (False, True):
+            imports = [measure_import(cwd, prewarm) for _ in range(runs)]
+            responses = [measure_first_response(cwd, prewarm) for _ in range(runs)]
+            label = 'pre-warm on ' if prewarm else 'pre-warm off'
+            print(f"{label}  import app {statistics.median(i['import'] for i in imports) * 1000:>7.1f} ms   "
+                  f"create_app {statistics.median(i['create_app'] for i in imports) * 1000:>6.1f} ms   "
+                  f"first response {statistics.median(r[0] for r in responses) * 1000:>7.1f} ms")
+            if prewarm:
+                seconds = [body['prewarm']['seconds'] for _, body in responses if body['prewarm']['seconds']]
+                statuses = sorted({body['prewarm']['status'] for _, body in responses})
+                print(f"              pre-warm {statistics.median(seconds) * 1000:.1f} ms in the background "
+                      f"({', '.join(statuses)})")
+
+        print("\nslowest direct imports of `app` (cumulative):")
+        for microseconds, name in slowest_imports(cwd):
+            print(f"  {microseconds / 1000:>8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
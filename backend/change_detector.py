@@ -0,0 +1,556 @@
+import atexit
+import hashlib
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- Change Detection Configuration ---
+# Every device referenced by a deployed map is re-polled on its own schedule. A poll
+# that finds the same neighbor set doubles the device's interval (up to the maximum);
+# a poll that finds a change drops it to the minimum, so polling load follows churn
+# instead of growing with the size of the estate.
+MIN_POLL_INTERVAL_SECONDS = 60
+INITIAL_POLL_INTERVAL_SECONDS = 15 * 60
+MAX_POLL_INTERVAL_SECONDS = 6 * 60 * 60
+BACKOFF_FACTOR = 2
+# Spreads polls out so devices added together do not stay in lock-step.
+JITTER_FRACTION = 0.1
+POLL_WORKERS = 4
+# How often the set of deployed maps (and the devices they reference) is re-read.
+MAP_REFRESH_SECONDS = 5 * 60
+# Device schedules, stale flags and the neighbor sets each map was deployed against
+# all live here, so every worker process reports the same state and changes made
+# while the service was down are still detected after a restart.
+STATE_PATH = os.path.join('instance', 'topology.sqlite3')
+# Every process runs a scheduler thread, but only the one holding the lease polls.
+# The holder renews it at least every LEASE_RENEW_SECONDS; if it exits, another
+# process takes over once the lease expires.
+LEASE_SECONDS = 2 * 60
+LEASE_RENEW_SECONDS = 15
+
+_lock = threading.Lock()
+_stale_hooks = []
+# Maps whose hooks are running in this process, and the newest changes that arrived meanwhile.
+_hooks_running = set()
+_hooks_pending = {}
+_owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_thread = None
+_stop = threading.Event()
+_wake = threading.Event()
+
+
+@contextmanager
+def _connect(immediate=False):
+    """
+    Opens the topology store, commits on success, and always closes the connection.
+    With `immediate`, the write lock is taken up front, so a read-then-write cannot
+    race another process.
+    """
+    conn = sqlite3.connect(STATE_PATH, timeout=30)
+    try:
+        with conn:
+            if immediate:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+    finally:
+        conn.close()
+
+
+def init_store():
+    """Creates the SQLite topology store if it does not exist yet."""
+    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+    with _connect() as conn:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS baselines (
+                map_name TEXT NOT NULL,
+                ip TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                neighbors TEXT NOT NULL,
+                recorded_at REAL NOT NULL,
+                PRIMARY KEY (map_name, ip)
+            );
+            CREATE TABLE IF NOT EXISTS pending_baselines (
+                map_name TEXT NOT NULL,
+                ip TEXT NOT NULL,
+                PRIMARY KEY (map_name, ip)
+            );
+            CREATE TABLE IF NOT EXISTS map_devices (
+                map_name TEXT NOT NULL,
+                ip TEXT NOT NULL,
+                PRIMARY KEY (map_name, ip)
+            );
+            CREATE INDEX IF NOT EXISTS map_devices_by_ip ON map_devices (ip);
+            CREATE TABLE IF NOT EXISTS devices (
+                ip TEXT PRIMARY KEY,
+                fingerprint TEXT,
+                neighbors TEXT,
+                interval REAL NOT NULL,
+                next_poll_at REAL NOT NULL,
+                last_polled_at REAL,
+                last_changed_at REAL,
+                polls INTEGER NOT NULL DEFAULT 0,
+                changes INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS devices_by_next_poll ON devices (next_poll_at);
+            CREATE TABLE IF NOT EXISTS stale_maps (
+                map_name TEXT PRIMARY KEY,
+                stale_since TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS stale_devices (
+                map_name TEXT NOT NULL,
+                ip TEXT NOT NULL,
+                added TEXT NOT NULL,
+                removed TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                detected_at TEXT NOT NULL,
+                PRIMARY KEY (map_name, ip)
+            );
+            CREATE TABLE IF NOT EXISTS scheduler_lease (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+        """)
+
+
+def neighbor_fingerprint(neighbors):
+    """A stable hash of a neighbor set that ignores the order neighbors were reported in."""
+    entries = sorted(json.dumps(_neighbor_key(neighbor)) for neighbor in neighbors)
+    return hashlib.sha1('\n'.join(entries).encode('utf-8')).hexdigest()
+
+
+def _neighbor_key(neighbor):
+    return [neighbor.get('interface'), neighbor.get('ip'), neighbor.get('hostname'), neighbor.get('bandwidth')]
+
+
+def _jittered(interval):
+    return interval * random.uniform(1 - JITTER_FRACTION, 1 + JITTER_FRACTION)
+
+
+def _placeholders(values):
+    return ','.join('?' * len(values))
+
+
+def register_stale_hook(callback):
+    """
+    Registers `callback(map_name, changes)`, called in a background thread of the
+    scheduling process whenever a map becomes stale. `changes` maps each changed
+    device IP to its current `neighbors` and the neighbors `added` and `removed`
+    since the deployment.
+    """
+    if callback not in _stale_hooks:
+        _stale_hooks.append(callback)
+
+
+def _add_devices(conn, ips, now):
+    conn.executemany(
+        "INSERT OR IGNORE INTO devices (ip, interval, next_poll_at) VALUES (?, ?, ?)",
+        [(ip, INITIAL_POLL_INTERVAL_SECONDS, now) for ip in ips]
+    )
+
+
+def record_deployment(map_name, ips):
+    """
+    Called when `map_name` is (re)deployed, from any process. Its old baseline and
+    stale flag are dropped, and the scheduler polls `ips` promptly to record the
+    neighbor sets the map was deployed against. A device that cannot be polled then
+    gets the first neighbor set a later poll returns as its baseline.
+    """
+    ips = sorted(set(ips))
+    with _connect(immediate=True) as conn:
+        for table in ('baselines', 'pending_baselines', 'map_devices', 'stale_devices', 'stale_maps'):
+            conn.execute(f"DELETE FROM {table} WHERE map_name = ?", (map_name,))
+        conn.executemany("INSERT INTO map_devices (map_name, ip) VALUES (?, ?)", [(map_name, ip) for ip in ips])
+        conn.executemany("INSERT INTO pending_baselines (map_name, ip) VALUES (?, ?)", [(map_name, ip) for ip in ips])
+        _add_devices(conn, ips, time.time())
+    # Only wakes this process's scheduler; another process's picks them up on its next renewal.
+    _wake.set()
+
+
+def _store_baselines(conn, rows, replace=True):
+    """Writes `(map_name, ip, neighbors)` rows; with `replace=False` existing baselines win."""
+    now = time.time()
+    verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+    conn.executemany(
+        f"{verb} INTO baselines (map_name, ip, fingerprint, neighbors, recorded_at) VALUES (?, ?, ?, ?, ?)",
+        [(map_name, ip, neighbor_fingerprint(neighbors), json.dumps(neighbors), now)
+         for map_name, ip, neighbors in rows]
+    )
+
+
+def _load_baselines(ips):
+    """Returns `{(map_name, ip): (fingerprint, neighbors)}` for the given devices."""
+    ips = list(ips)
+    if not ips:
+        return {}
+    with _connect() as conn:
+        rows = conn.execute(
+            f"SELECT map_name, ip, fingerprint, neighbors FROM baselines WHERE ip IN ({_placeholders(ips)})", ips
+        ).fetchall()
+    return {(map_name, ip): (fingerprint, json.loads(neighbors)) for map_name, ip, fingerprint, neighbors in rows}
+
+
+def refresh_watched_devices(map_devices, now=None):
+    """
+    Replaces the map -> device IPs index. New devices are scheduled right away so their
+    first poll records a baseline fingerprint; devices no longer on any map stop being
+    polled.
+    """
+    now = time.time() if now is None else now
+    with _connect(immediate=True) as conn:
+        conn.execute("DELETE FROM map_devices")
+        conn.executemany("INSERT INTO map_devices (map_name, ip) VALUES (?, ?)",
+                         [(map_name, ip) for map_name, ips in map_devices.items() for ip in set(ips)])
+        _add_devices(conn, set().union(*map_devices.values()) if map_devices else set(), now)
+        conn.execute("DELETE FROM devices WHERE ip NOT IN (SELECT ip FROM map_devices)")
+
+
+def _due_devices(now):
+    with _connect() as conn:
+        return [ip for (ip,) in conn.execute("SELECT ip FROM devices WHERE next_poll_at <= ?", (now,))]
+
+
+def _next_due_at():
+    with _connect() as conn:
+        return conn.execute("SELECT MIN(next_poll_at) FROM devices").fetchone()[0]
+
+
+def _diff_neighbors(old, new):
+    old_keys = {json.dumps(_neighbor_key(n)): n for n in old or []}
+    new_keys = {json.dumps(_neighbor_key(n)): n for n in new}
+    return ([new_keys[key] for key in new_keys.keys() - old_keys.keys()],
+            [old_keys[key] for key in old_keys.keys() - new_keys.keys()])
+
+
+def _record_polls(polled, now):
+    """
+    Updates each polled device's fingerprint and schedule (`polled` is `{ip: neighbors}`).
+    A device whose neighbor set differs from its previous poll's drops to the minimum
+    interval; this only drives polling, as staleness is judged against the deployed
+    baselines. `neighbors` is None when the poll failed, which backs off without a
+    change. Returns the number of devices that changed.
+    """
+    changed = 0
+    with _connect(immediate=True) as conn:
+        for ip, neighbors in polled.items():
+            row = conn.execute("SELECT fingerprint, interval FROM devices WHERE ip = ?", (ip,)).fetchone()
+            if row is None:
+                continue
+            previous, interval = row
+
+            change = False
+            if neighbors is not None:
+                fingerprint = neighbor_fingerprint(neighbors)
+                change = previous is not None and fingerprint != previous
+                conn.execute("UPDATE devices SET fingerprint = ?, neighbors = ? WHERE ip = ?",
+                             (fingerprint, json.dumps(neighbors), ip))
+
+            interval = MIN_POLL_INTERVAL_SECONDS if change else min(interval * BACKOFF_FACTOR, MAX_POLL_INTERVAL_SECONDS)
+            conn.execute(
+                "UPDATE devices SET interval = ?, next_poll_at = ?, last_polled_at = ?, polls = polls + 1, "
+                "changes = changes + ?, last_changed_at = CASE WHEN ? THEN ? ELSE last_changed_at END WHERE ip = ?",
+                (interval, now + _jittered(interval), now, int(change), change, now, ip)
+            )
+            changed += change
+    return changed
+
+
+def _compare_with_baselines(results):
+    """
+    Compares freshly polled neighbor sets (`{ip: neighbors}`) with the baselines of
+    every map that references each device. Returns `{map_name: {ip: change}}` for the
+    devices that differ, where `added` and `removed` are relative to the deployment,
+    plus `{map_name: ips}` for devices that are back to their baseline. Devices
+    without a baseline get this poll's neighbors as one.
+    """
+    if not results:
+        return {}, {}
+    ips = list(results)
+    with _connect() as conn:
+        watching = conn.execute(
+            f"SELECT map_name, ip FROM map_devices WHERE ip IN ({_placeholders(ips)})", ips
+        ).fetchall()
+    baselines = _load_baselines(ips)
+
+    differing, matching, missing = {}, {}, []
+    for map_name, ip in watching:
+        neighbors = results[ip]
+        baseline = baselines.get((map_name, ip))
+        if baseline is None:
+            missing.append((map_name, ip, neighbors))
+        elif baseline[0] == neighbor_fingerprint(neighbors):
+            matching.setdefault(map_name, set()).add(ip)
+        else:
+            added, removed = _diff_neighbors(baseline[1], neighbors)
+            differing.setdefault(map_name, {})[ip] = {
+                'neighbors': neighbors, 'added': added, 'removed': removed,
+                'fingerprint': neighbor_fingerprint(neighbors),
+            }
+    if missing:
+        with _connect() as conn:
+            _store_baselines(conn, missing, replace=False)
+    return differing, matching
+
+
+def _mark_stale(differing, matching, now):
+    """
+    Updates the stale flags and returns `{map_name: changes}` for the maps whose
+    changes were not reported before, so hooks run once per distinct change rather
+    than on every poll of a device that is still different from its baseline.
+    """
+    detected_at = datetime.utcfromtimestamp(now).isoformat()
+    new = {}
+    with _connect(immediate=True) as conn:
+        for map_name, ips in matching.items():
+            conn.executemany("DELETE FROM stale_devices WHERE map_name = ? AND ip = ?",
+                             [(map_name, ip) for ip in ips])
+            conn.execute("DELETE FROM stale_maps WHERE map_name = ? AND NOT EXISTS "
+                         "(SELECT 1 FROM stale_devices WHERE map_name = ?)", (map_name, map_name))
+
+        for map_name, map_changes in differing.items():
+            conn.execute("INSERT OR IGNORE INTO stale_maps (map_name, stale_since) VALUES (?, ?)",
+                         (map_name, detected_at))
+            for ip, change in map_changes.items():
+                known = conn.execute("SELECT fingerprint FROM stale_devices WHERE map_name = ? AND ip = ?",
+                                     (map_name, ip)).fetchone()
+                if known and known[0] == change['fingerprint']:
+                    continue
+                conn.execute(
+                    "INSERT OR REPLACE INTO stale_devices (map_name, ip, added, removed, fingerprint, detected_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (map_name, ip, json.dumps(change['added']), json.dumps(change['removed']),
+                     change['fingerprint'], detected_at)
+                )
+                new[map_name] = map_changes
+    return new
+
+
+def _poll(fetch_neighbors, ip):
+    """Polls one device. Returns its neighbor list, or None if the poll failed."""
+    # A device that is unknown or unreachable (None) or raises is a failed poll, not
+    # a device whose neighbors all went away; it must never be diffed.
+    try:
+        result = fetch_neighbors(ip)
+    except Exception as e:
+        print(f"Change detection poll of {ip} failed: {e}")
+        return None
+    if result is None:
+        print(f"Change detection poll of {ip} failed: no response")
+        return None
+    return result.get('neighbors') or []
+
+
+def record_pending_baselines(fetch_neighbors, executor):
+    """Polls the devices of newly deployed maps and stores their baselines. Returns the number of maps."""
+    with _connect(immediate=True) as conn:
+        rows = conn.execute("SELECT map_name, ip FROM pending_baselines").fetchall()
+        conn.execute("DELETE FROM pending_baselines")
+    if not rows:
+        return 0
+
+    pending = {}
+    for map_name, ip in rows:
+        pending.setdefault(map_name, set()).add(ip)
+    ips = sorted({ip for _, ip in rows})
+    polled = dict(zip(ips, executor.map(lambda ip: _poll(fetch_neighbors, ip), ips)))
+    with _connect() as conn:
+        _store_baselines(conn, [(map_name, ip, polled[ip]) for map_name, ip in rows if polled[ip] is not None])
+    return len(pending)
+
+
+def run_due_polls(fetch_neighbors, executor, now=None):
+    """
+    Polls every device that is due, flags the maps whose devices differ from their
+    deployed baselines and runs the stale hooks for newly changed maps. Returns the
+    number of devices polled.
+    """
+    now = time.time() if now is None else now
+    due = _due_devices(now)
+    if not due:
+        return 0
+
+    polled = dict(zip(due, executor.map(lambda ip: _poll(fetch_neighbors, ip), due)))
+    _record_polls(polled, time.time())
+    results = {ip: neighbors for ip, neighbors in polled.items() if neighbors is not None}
+
+    differing, matching = _compare_with_baselines(results)
+    stale = _mark_stale(differing, matching, time.time())
+    if stale:
+        print(f"Topology changed since deployment on maps {sorted(stale)}")
+        for map_name, map_changes in stale.items():
+            _start_hooks(map_name, map_changes)
+    return len(due)
+
+
+def _start_hooks(map_name, changes):
+    """
+    Runs the stale hooks for a map in a background thread. If they are still running
+    for that map, the newest changes are queued and handled once they finish, so two
+    hook runs (e.g. re-renders) never overlap for the same map.
+    """
+    if not _stale_hooks:
+        return
+    with _lock:
+        if map_name in _hooks_running:
+            _hooks_pending[map_name] = changes
+            return
+        _hooks_running.add(map_name)
+    threading.Thread(target=_run_hooks, args=(map_name, changes), daemon=True).start()
+
+
+def _run_hooks(map_name, changes):
+    while True:
+        for hook in _stale_hooks:
+            try:
+                hook(map_name, changes)
+            except Exception as e:
+                print(f"Stale map hook failed for {map_name}: {e}")
+        with _lock:
+            changes = _hooks_pending.pop(map_name, None)
+            if changes is None:
+                _hooks_running.discard(map_name)
+                return
+
+
+def acquire_lease(now=None):
+    """
+    Takes or renews the scheduler lease for this process. Returns True while this
+    process holds it. A single upsert decides, so two processes can never both win.
+    """
+    now = time.time() if now is None else now
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO scheduler_lease (name, owner, expires_at) VALUES ('scheduler', ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE scheduler_lease.owner = excluded.owner OR scheduler_lease.expires_at < ?",
+            (_owner, now + LEASE_SECONDS, now)
+        )
+        owner = conn.execute("SELECT owner FROM scheduler_lease WHERE name = 'scheduler'").fetchone()[0]
+    return owner == _owner
+
+
+def release_lease():
+    """Gives up the scheduler lease so another process can take over right away."""
+    with _connect() as conn:
+        conn.execute("DELETE FROM scheduler_lease WHERE name = 'scheduler' AND owner = ?", (_owner,))
+
+
+def _scheduler_loop(fetch_neighbors, list_map_devices):
+    next_refresh = 0
+    with ThreadPoolExecutor(max_workers=POLL_WORKERS) as executor:
+        while not _stop.is_set():
+            try:
+                if not acquire_lease():
+                    # Re-read the deployed maps as soon as this process takes over.
+                    next_refresh = 0
+                    _stop.wait(LEASE_RENEW_SECONDS)
+                    continue
+
+                now = time.time()
+                if now >= next_refresh:
+                    try:
+                        refresh_watched_devices(list_map_devices(), now)
+                    except Exception as e:
+                        print(f"Change detection could not list deployed maps: {e}")
+                    next_refresh = now + MAP_REFRESH_SECONDS
+
+                record_pending_baselines(fetch_neighbors, executor)
+                run_due_polls(fetch_neighbors, executor)
+                next_due = _next_due_at() or next_refresh
+            except sqlite3.Error as e:
+                print(f"Change detection could not update the topology store: {e}")
+                next_due = time.time() + LEASE_RENEW_SECONDS
+
+            # Deployments in this process wake the loop early so their baselines are
+            # recorded promptly; the lease is renewed well before it expires.
+            _wake.wait(max(0.5, min(next_due, next_refresh, time.time() + LEASE_RENEW_SECONDS) - time.time()))
+            _wake.clear()
+
+
+def start(fetch_neighbors, list_map_devices):
+    """
+    Starts the change-detection scheduler in a daemon thread (once per process).
+    Every worker process may start one; only the holder of the scheduler lease
+    polls, so device polling does not multiply with the number of workers.
+    `fetch_neighbors(ip)` returns `{'neighbors': [...]}` or None, like
+    `services.get_device_neighbors`; `list_map_devices()` returns `{map_name: ips}`.
+    """
+    global _thread
+    if _thread is None:
+        _stop.clear()
+        _thread = threading.Thread(target=_scheduler_loop, args=(fetch_neighbors, list_map_devices), daemon=True)
+        _thread.start()
+        atexit.register(release_lease)
+    return _thread
+
+
+def clear_stale(map_name):
+    """
+    Acknowledges a stale map after it was reviewed: the last polled neighbors of its
+    changed devices become their baselines, so the same change is not flagged again.
+    Returns False if the map was not stale.
+    """
+    with _connect(immediate=True) as conn:
+        if not conn.execute("DELETE FROM stale_maps WHERE map_name = ?", (map_name,)).rowcount:
+            return False
+        rows = conn.execute(
+            "SELECT s.ip, d.neighbors FROM stale_devices s JOIN devices d ON d.ip = s.ip "
+            "WHERE s.map_name = ? AND d.neighbors IS NOT NULL",
+            (map_name,)
+        ).fetchall()
+        conn.execute("DELETE FROM stale_devices WHERE map_name = ?", (map_name,))
+        _store_baselines(conn, [(map_name, ip, json.loads(neighbors)) for ip, neighbors in rows])
+    return True
+
+
+def get_status():
+    """A snapshot of the stale maps and of the polling schedule."""
+    now = time.time()
+    with _connect() as conn:
+        stale_maps = {
+            map_name: {'map_name': map_name, 'stale_since': stale_since, 'devices': {}}
+            for map_name, stale_since in conn.execute("SELECT map_name, stale_since FROM stale_maps ORDER BY map_name")
+        }
+        for map_name, ip, added, removed, detected_at in conn.execute(
+                "SELECT map_name, ip, added, removed, detected_at FROM stale_devices"):
+            if map_name in stale_maps:
+                stale_maps[map_name]['devices'][ip] = {
+                    'added': json.loads(added), 'removed': json.loads(removed), 'detected_at': detected_at,
+                }
+        watched_maps = conn.execute("SELECT COUNT(DISTINCT map_name) FROM map_devices").fetchone()[0]
+        devices, due, poll_rate, polls, changes = conn.execute(
+            "SELECT COUNT(*), SUM(next_poll_at <= ?), SUM(3600.0 / interval), SUM(polls), SUM(changes) FROM devices",
+            (now + 60,)
+        ).fetchone()
+        lease = conn.execute("SELECT owner, expires_at FROM scheduler_lease WHERE name = 'scheduler'").fetchone()
+    return {
+        'stale_maps': list(stale_maps.values()),
+        'watched_maps': watched_maps,
+        'watched_devices': devices,
+        'due_within_minute': due or 0,
+        # Expected polls per hour at the current intervals.
+        'poll_rate_per_hour': round(poll_rate or 0, 1),
+        'total_polls': polls or 0,
+        'total_changes': changes or 0,
+        # The process currently polling, if any.
+        'scheduler': lease[0] if lease and lease[1] >= now else None,
+    }
+
+
+def get_devices():
+    """Per-device polling state, without the stored neighbor lists."""
+    with _connect() as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(
+            "SELECT ip, fingerprint, interval, next_poll_at, last_polled_at, last_changed_at, polls, changes "
+            "FROM devices ORDER BY ip"
+        ).fetchall()
+    return [dict(row) for row in rows]
@@ -0,0 +1,296 @@
+import hashlib
+import math
+import re
+
+# Weathermap configuration template, also served via `/config-template`.
+CONFIG_TEMPLATE = """
+# Automatically generated by AutoCacti Map Creator
+
+BACKGROUND images/backgrounds/%name%.png
+WIDTH %width%
+HEIGHT %height%
+TITLE %name%
+
+KEYTEXTCOLOR 0 0 0
+KEYOUTLINECOLOR 0 0 0
+KEYBGCOLOR 255 255 255
+TITLECOLOR 0 0 0
+TIMECOLOR 0 0 0
+SCALE DEFAULT 0  0   192 192 192
+SCALE DEFAULT 0  1   255 255 255
+SCALE DEFAULT 1  10  140 0 255
+SCALE DEFAULT 10 25  32 32 255
+SCALE DEFAULT 25 40  0 192 255
+SCALE DEFAULT 40 55  0 240 0
+SCALE DEFAULT 55 70  240 240 0
+SCALE DEFAULT 70 85  255 192 0
+SCALE DEFAULT 85 100 255 0 0
+
+SET key_hidezero_DEFAULT 1
+
+# End of global section
+
+# TEMPLATE-only NODEs:
+# TEMPLATE-only LINKs:
+LINK DEFAULT
+    WIDTH 3
+    BWLABEL bits
+    BANDWIDTH 10000M
+
+# regular NODEs:
+%nodes%
+
+# regular LINKs:
+%links%
+
+# That's All Folks!
+""".strip()
+
+# NODE_WIDTH and NODE_HEIGHT must match `frontend/src/config/constants.js`.
+NODE_WIDTH = 140
+NODE_HEIGHT = 140
+CONFIG_X_OFFSET = 0
+CONFIG_Y_OFFSET = 0
+# An offset to ensure link endpoints land safely inside the node's visual boundary.
+LINK_ENDPOINT_OFFSET = 70
+# The perpendicular distance between parallel links.
+PARALLEL_LINK_OFFSET = 15
+
+def _js_round(value):
+    """Rounds half up like JavaScript's Math.round, so output matches the browser generator."""
+    return math.floor(value + 0.5)
+
+
+def _link_id(source, target, interface, occurrence):
+    """
+    Derives a stable LINK name from the edge itself rather than from its position in
+    the edge list, so adding one link does not rename every block after it.
+    """
+    key = f"{source}|{target}|{interface}|{occurrence}".encode('utf-8')
+    return f"link{hashlib.sha1(key).hexdigest()[:10]}"
+
+
+def generate_blocks(document):
+    """
+    Builds the NODE/LINK blocks for a structured map document.
+
+    The document carries the same data the browser generator works from:
+    `nodes` and `edges` (React Flow shape, positions already in final image
+    coordinates) and an optional `scaleFactor`. With `renderNodes` set, invisible
+    device NODE blocks are added so the server can draw icons and labels itself,
+    using the optional `theme` ('light' or 'dark').
+
+    Returns `(blocks, map_data)`. `blocks` is an ordered dict mapping
+    ('NODE' | 'LINK', name) to the block text. `map_data` has the shape returned
+    by `map_renderer.parse_config`, so the renderer can use it without re-parsing.
+    """
+    nodes = document.get('nodes') or []
+    edges = document.get('edges') or []
+    scale_factor = float(document.get('scaleFactor') or 1)
+
+    node_info = {node['id']: node for node in nodes if node.get('type') != 'group' and 'id' in node}
+
+    # Group edges by the pair of nodes they connect, regardless of direction.
+    edge_groups = {}
+    for edge in edges:
+        key = tuple(sorted((str(edge.get('source')), str(edge.get('target')))))
+        edge_groups.setdefault(key, []).append(edge)
+
+    node_blocks = {}
+    link_blocks = {}
+    map_data = {'nodes': {}, 'links': []}
+
+    for (node_a_id, node_b_id), edge_group in edge_groups.items():
+        # De-duplicate edges reported from both ends: use the direction with more entries,
+        # preferring the canonical (lexicographically smaller source) direction on a tie.
+        forward_edges = [e for e in edge_group if str(e.get('source')) == node_a_id]
+        reverse_edges = [e for e in edge_group if str(e.get('source')) == node_b_id]
+        edges_to_process = forward_edges if len(forward_edges) >= len(reverse_edges) else reverse_edges
+
+        total = len(edges_to_process)
+        initial_offset = -PARALLEL_LINK_OFFSET * (total - 1) / 2
+        seen = {}
+
+        for i, edge in enumerate(edges_to_process):
+            source = node_info.get(edge.get('source'))
+            target = node_info.get(edge.get('target'))
+            if not source or not target:
+                continue
+
+            source_cx = source['position']['x'] + NODE_WIDTH / 2
+            source_cy = source['position']['y'] + NODE_HEIGHT / 2
+            target_cx = target['position']['x'] + NODE_WIDTH / 2
+            target_cy = target['position']['y'] + NODE_HEIGHT / 2
+
+            dx = target_cx - source_cx
+            dy = target_cy - source_cy
+            distance = math.sqrt(dx * dx + dy * dy)
+            if distance == 0:
+                continue
+
+            # Unit vector along the link, and the perpendicular used for parallel offsets.
+            ux, uy = dx / distance, dy / distance
+            px, py = -uy, ux
+            offset = initial_offset + i * PARALLEL_LINK_OFFSET
+            offset_x, offset_y = px * offset, py * offset
+
+            x1 = _js_round((source_cx + offset_x + ux * LINK_ENDPOINT_OFFSET) * scale_factor) + CONFIG_X_OFFSET
+            y1 = _js_round((source_cy + offset_y + uy * LINK_ENDPOINT_OFFSET) * scale_factor) + CONFIG_Y_OFFSET
+            x2 = _js_round((target_cx + offset_x - ux * LINK_ENDPOINT_OFFSET) * scale_factor) + CONFIG_X_OFFSET
+            y2 = _js_round((target_cy + offset_y - uy * LINK_ENDPOINT_OFFSET) * scale_factor) + CONFIG_Y_OFFSET
+
+            edge_data = edge.get('data') or {}
+            interface = edge_data.get('interface') or 'unknown'
+            bandwidth = edge_data.get('bandwidth') or '1G'
+            source_data = source.get('data') or {}
+
+            occurrence_key = (edge.get('source'), edge.get('target'), interface)
+            seen[occurrence_key] = seen.get(occurrence_key, 0) + 1
+            link_name = _link_id(*occurrence_key, seen[occurrence_key])
+            node1, node2 = f"{link_name}a", f"{link_name}b"
+
+            # The invisible anchor nodes required for the link.
+            node_blocks[('NODE', node1)] = f"NODE {node1}\n\tPOSITION {x1} {y1}"
+            node_blocks[('NODE', node2)] = f"NODE {node2}\n\tPOSITION {x2} {y2}"
+            link_blocks[('LINK', f"{node1}-{node2}")] = (
+                f"LINK {node1}-{node2}\n"
+                f"\tNODES {node1} {node2}\n"
+                f"\tDEVICE {source_data.get('hostname')} {source_data.get('ip')}\n"
+                f"\tINTERFACE {interface}\n"
+                f"\tBANDWIDTH {bandwidth}"
+            )
+
+            map_data['nodes'][node1] = {'x': x1, 'y': y1}
+            map_data['nodes'][node2] = {'x': x2, 'y': y2}
+            map_data['links'].append({'node1': node1, 'node2': node2, 'bandwidth': bandwidth})
+
+    if document.get('renderNodes'):
+        map_data['theme'] = document.get('theme') or 'light'
+        map_data['scale_factor'] = scale_factor
+        for node in node_info.values():
+            if node.get('type', 'custom') != 'custom':
+                continue
+            name, block, node_data = _device_node_block(node, scale_factor)
+            node_blocks[('NODE', name)] = block
+            map_data['nodes'][name] = node_data
+
+    blocks = dict(node_blocks)
+    blocks.update(link_blocks)
+    return blocks, map_data
+
+
+def _device_node_block(node, scale_factor):
+    """
+    Builds an invisible NODE block for a device. Weathermap draws nothing for a node
+    without LABEL or ICON; the AutoCacti renderer reads the `autocacti_*` hints to
+    draw the device icon and labels onto the final map.
+    """
+    data = node.get('data') or {}
+    name = 'dev_' + re.sub(r'[^A-Za-z0-9_]', '_', str(node['id']))
+    x = _js_round((node['position']['x'] + NODE_WIDTH / 2) * scale_factor) + CONFIG_X_OFFSET
+    y = _js_round((node['position']['y'] + NODE_HEIGHT / 2) * scale_factor) + CONFIG_Y_OFFSET
+
+    node_data = {'x': x, 'y': y, 'icon': data.get('iconType') or 'Unknown'}
+    lines = [f"NODE {name}", f"\tPOSITION {x} {y}", f"\tSET autocacti_icon {node_data['icon']}"]
+    if data.get('hostname'):
+        node_data['label'] = str(data['hostname'])
+        lines.append(f"\tSET autocacti_label {node_data['label']}")
+    if data.get('ip'):
+        node_data['sublabel'] = str(data['ip'])
+        lines.append(f"\tSET autocacti_sublabel {node_data['sublabel']}")
+    return name, '\n'.join(lines), node_data
+
+
+def diff_blocks(old_blocks, new_blocks):
+    """Returns the NODE/LINK blocks that were added, changed or removed between two generations."""
+    delta = {'added': {}, 'changed': {}, 'removed': []}
+    for key, text in new_blocks.items():
+        if key not in old_blocks:
+            delta['added'][key[1]] = text
+        elif old_blocks[key] != text:
+            delta['changed'][key[1]] = text
+    delta['removed'] = [key[1] for key in old_blocks if key not in new_blocks]
+    return delta
+
+
+def parse_blocks(config_content):
+    """
+    Splits a generated `.conf` back into its NODE/LINK blocks, keyed like the blocks
+    from `generate_blocks`, so a new generation can be compared with what was deployed.
+    The template's `DEFAULT` blocks are not part of a generation and are skipped.
+    """
+    blocks = {}
+    current = None
+    for line in config_content.split('\n'):
+        if line.startswith(('NODE ', 'LINK ')):
+            kind, _, name = line.partition(' ')
+            current = [line] if name.strip() != 'DEFAULT' else None
+            if current is not None:
+                blocks[(kind, name.strip())] = current
+        elif current is not None and line.startswith('\t'):
+            current.append(line)
+        else:
+            current = None
+    return {key: '\n'.join(lines) for key, lines in blocks.items()}
+
+
+def regenerate_config(map_name, document, previous_blocks=None):
+    """
+    Generates the config for `map_name` from a structured document. The returned dict
+    holds everything needed to assemble the final `.conf` text plus a `delta` of the
+    blocks that differ from `previous_blocks` (those of the deployed config; everything
+    counts as added when there are none). Nothing is recorded, so this is safe to call
+    for a dry run.
+
+    The delta only reports what changed. The whole document is still uploaded and the
+    whole config regenerated and stored on every upload, so an edit costs the same as
+    a first upload; the blocks are cheap to build compared with rendering the map.
+    """
+    blocks, map_data = generate_blocks(document)
+    return {
+        'map_name': map_name,
+        'width': document.get('width'),
+        'height': document.get('height'),
+        'blocks': blocks,
+        'map_data': map_data,
+        'delta': diff_blocks(previous_blocks or {}, blocks),
+    }
+
+
+def _render_hints(map_data):
+    """
+    Global `SET autocacti_*` lines carrying what the renderer needs beyond the blocks,
+    so a config re-parsed later (bulk jobs, re-renders) draws nodes the same way.
+    """
+    if 'theme' not in map_data:
+        return []
+    return [
+        f"SET autocacti_theme {map_data['theme']}",
+        f"SET autocacti_scale {map_data['scale_factor']:g}",
+        '',
+    ]
+
+
+def assemble_config(generated, background_path):
+    """
+    Builds the final `.conf` text for a generation, pointing BACKGROUND at
+    `background_path` directly instead of patching it into finished text.
+    """
+    header_lines = []
+    for line in CONFIG_TEMPLATE.split('\n'):
+        if line.startswith('BACKGROUND '):
+            line = f"BACKGROUND {background_path}"
+        if line == '# End of global section':
+            header_lines.extend(_render_hints(generated['map_data']))
+        header_lines.append(line)
+
+    node_blocks = [text for (kind, _), text in generated['blocks'].items() if kind == 'NODE']
+    link_blocks = [text for (kind, _), text in generated['blocks'].items() if kind == 'LINK']
+
+    config = '\n'.join(header_lines)
+    config = config.replace('%name%', generated['map_name'])
+    config = config.replace('%width%', str(generated['width']))
+    config = config.replace('%height%', str(generated['height']))
+    config = config.replace('%nodes%', '\n\n'.join(node_blocks))
+    config = config.replace('%links%', '\n\n'.join(link_blocks))
+    return config.strip()
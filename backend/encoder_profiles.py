@@ -0,0 +1,19 @@
+# --- Output Encoder Profiles ---
+# Selectable per Cacti group. 'png' keeps Pillow's default settings; the others trade
+# encode time against file size for the mostly flat map backgrounds. 'png-small'
+# quantizes to a 256-colour palette, which is lossy, so it is only ever opt-in.
+# This module has no Pillow dependency, so request handlers can validate a profile
+# name without importing the renderer; `map_renderer` applies the profiles.
+ENCODER_PROFILES = {
+    'png': {'extension': '.png', 'format': 'PNG', 'options': {}},
+    'png-fast': {'extension': '.png', 'format': 'PNG', 'options': {'compress_level': 1}},
+    'png-small': {'extension': '.png', 'format': 'PNG', 'options': {'compress_level': 6}, 'quantize': 256},
+    'webp-lossless': {'extension': '.webp', 'format': 'WEBP', 'options': {'lossless': True, 'quality': 80, 'method': 4}},
+}
+DEFAULT_ENCODER_PROFILE = 'png'
+
+def get_encoder_profile(profile_name):
+    """Returns the encoder profile by name, raising ValueError for unknown profiles."""
+    if profile_name not in ENCODER_PROFILES:
+        raise ValueError(f"Unknown encoder profile '{profile_name}'. Available: {', '.join(ENCODER_PROFILES)}")
+    return ENCODER_PROFILES[profile_name]
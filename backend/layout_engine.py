@@ -0,0 +1,245 @@
+import numpy as np
+
+# --- Layout Configuration ---
+# These mirror the spacing constants used by the browser layout in
+# `frontend/src/hooks/useAutoLayout.js` so server and client layouts look alike.
+NODE_SPACING = 180  # Ideal edge length between two connected devices
+BASE_X = 100  # Top-left corner of a freshly laid-out map
+BASE_Y = 100
+
+# Device type hierarchy - lower number = higher in the visual hierarchy (top of map)
+DEVICE_HIERARCHY = {
+    'Router': 1,
+    'Firewall': 2,
+    'Encryptor': 3,
+    'Switch': 4,
+    'Unknown': 5,
+}
+
+# Below this many nodes the exact O(n^2) repulsion is cheaper than building a grid.
+EXACT_REPULSION_THRESHOLD = 400
+# Number of nodes processed per block when evaluating node-to-cell repulsion,
+# which keeps the temporary (block x cells) arrays small on very large maps.
+REPULSION_BLOCK_SIZE = 2048
+# Hard cap on the size of a single layout request.
+MAX_LAYOUT_NODES = 20000
+
+FULL_ITERATIONS = 120
+INCREMENTAL_ITERATIONS = 60
+GRAVITY = 0.02  # Weak pull to the centre so disconnected islands stay close
+EPSILON = 1e-6
+
+
+def _exact_repulsion(pos, movable_idx, k2):
+    """Exact Fruchterman-Reingold repulsion of every movable node against all nodes."""
+    delta = pos[movable_idx, None, :] - pos[None, :, :]
+    dist2 = np.einsum('ijk,ijk->ij', delta, delta)
+    # A node does not repel itself.
+    dist2[np.arange(len(movable_idx)), movable_idx] = np.inf
+    np.maximum(dist2, EPSILON, out=dist2)
+    return np.einsum('ijk,ij->ik', delta, k2 / dist2)
+
+
+def _grid_repulsion(pos, movable_idx, k2):
+    """
+    Approximates repulsion by binning all nodes into a uniform grid and letting each
+    movable node interact with the centroid of every occupied cell. A node's own cell
+    is evaluated with the node removed from the centroid, so two nodes sharing a cell
+    still push each other apart. Cost is O(movable * cells) instead of O(n^2).
+    """
+    n = len(pos)
+    side = max(2, int(np.sqrt(n) / 3))
+    lo = pos.min(axis=0)
+    extent = np.maximum(pos.max(axis=0) - lo, EPSILON)
+    cell_xy = np.minimum((side * (pos - lo) / extent).astype(np.int64), side - 1)
+    cell_of_node = cell_xy[:, 0] * side + cell_xy[:, 1]
+
+    # Compact to the occupied cells only.
+    _, cell_of_node = np.unique(cell_of_node, return_inverse=True)
+    counts = np.bincount(cell_of_node).astype(np.float64)
+    sums = np.stack([
+        np.bincount(cell_of_node, weights=pos[:, 0]),
+        np.bincount(cell_of_node, weights=pos[:, 1]),
+    ], axis=1)
+    centroids = sums / counts[:, None]
+
+    forces = np.empty((len(movable_idx), 2))
+    for start in range(0, len(movable_idx), REPULSION_BLOCK_SIZE):
+        block = movable_idx[start:start + REPULSION_BLOCK_SIZE]
+        own_cell = cell_of_node[block]
+        rows = np.arange(len(block))
+
+        dx = pos[block, 0, None] - centroids[None, :, 0]
+        dy = pos[block, 1, None] - centroids[None, :, 1]
+        weight = dx * dx
+        weight += dy * dy
+        np.maximum(weight, EPSILON, out=weight)
+        np.divide(counts * k2, weight, out=weight)
+        weight[rows, own_cell] = 0.0
+        block_forces = np.stack([(dx * weight).sum(axis=1), (dy * weight).sum(axis=1)], axis=1)
+
+        # Own cell: repel from the centroid of the *other* nodes in the cell.
+        others = counts[own_cell] - 1
+        has_others = others > 0
+        own_centroid = (sums[own_cell] - pos[block]) / np.maximum(others, 1)[:, None]
+        own_delta = pos[block] - own_centroid
+        own_dist2 = np.maximum(np.einsum('ij,ij->i', own_delta, own_delta), EPSILON)
+        block_forces += own_delta * np.where(has_others, others * k2 / own_dist2, 0.0)[:, None]
+
+        forces[start:start + len(block)] = block_forces
+    return forces
+
+
+def _attraction(pos, src, dst, k):
+    """Spring attraction along every edge, accumulated per node with bincount."""
+    n = len(pos)
+    delta = pos[src] - pos[dst]
+    dist = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+    pull = delta * (dist / k)[:, None]
+    forces = np.zeros((n, 2))
+    for axis in (0, 1):
+        forces[:, axis] = (np.bincount(dst, weights=pull[:, axis], minlength=n)
+                           - np.bincount(src, weights=pull[:, axis], minlength=n))
+    return forces
+
+
+def _relax(pos, src, dst, movable_idx, iterations, start_temperature, k):
+    """Runs the cooled force-directed simulation in place on `pos`."""
+    k2 = k * k
+    use_grid = len(pos) > EXACT_REPULSION_THRESHOLD
+    centre = pos.mean(axis=0)
+
+    for step in range(iterations):
+        temperature = start_temperature * (1 - step / iterations) + 1.0
+
+        if use_grid:
+            disp = _grid_repulsion(pos, movable_idx, k2)
+        else:
+            disp = _exact_repulsion(pos, movable_idx, k2)
+        disp += _attraction(pos, src, dst, k)[movable_idx]
+        disp -= GRAVITY * (pos[movable_idx] - centre)
+
+        # Limit each node's displacement to the current temperature.
+        length = np.sqrt(np.einsum('ij,ij->i', disp, disp))
+        scale = np.minimum(length, temperature) / np.maximum(length, EPSILON)
+        pos[movable_idx] += disp * scale[:, None]
+
+
+def _initial_positions(node_ids, nodes_by_id, src, dst, fixed, rng):
+    """
+    Builds the starting coordinates. Nodes with a usable position keep it. In a full
+    layout, unpositioned nodes are seeded in bands by device hierarchy; in incremental
+    mode they are dropped next to their already placed neighbours.
+    """
+    n = len(node_ids)
+    pos = np.zeros((n, 2))
+    placed = np.zeros(n, dtype=bool)
+
+    for i, node_id in enumerate(node_ids):
+        position = nodes_by_id[node_id].get('position') or {}
+        if isinstance(position.get('x'), (int, float)) and isinstance(position.get('y'), (int, float)):
+            pos[i] = (position['x'], position['y'])
+            placed[i] = True
+
+    if fixed is None:
+        # Full layout: ignore existing coordinates and start from a hierarchy-banded scatter.
+        spread = NODE_SPACING * max(1.0, np.sqrt(n))
+        levels = np.array([
+            DEVICE_HIERARCHY.get((nodes_by_id[node_id].get('data') or {}).get('iconType'), DEVICE_HIERARCHY['Unknown'])
+            for node_id in node_ids
+        ], dtype=np.float64)
+        pos[:, 0] = rng.uniform(0, spread, n)
+        pos[:, 1] = levels * spread / len(DEVICE_HIERARCHY) + rng.uniform(0, NODE_SPACING, n)
+        return pos
+
+    if not placed.any():
+        placed_centre = np.zeros(2)
+    else:
+        placed_centre = pos[placed].mean(axis=0)
+
+    # Place new nodes breadth-first so chains of new devices grow outwards from the map.
+    neighbours = [[] for _ in range(n)]
+    for a, b in zip(src.tolist(), dst.tolist()):
+        neighbours[a].append(b)
+        neighbours[b].append(a)
+
+    pending = [i for i in range(n) if not placed[i]]
+    while pending:
+        progressed = []
+        for i in pending:
+            anchors = [j for j in neighbours[i] if placed[j]]
+            if anchors:
+                angle = rng.uniform(0, 2 * np.pi)
+                pos[i] = pos[anchors].mean(axis=0) + NODE_SPACING * np.array([np.cos(angle), np.sin(angle)])
+                progressed.append(i)
+        for i in progressed:
+            placed[i] = True
+        if not progressed:
+            # Remaining nodes are not connected to anything placed; scatter them near the centre.
+            for i in pending:
+                pos[i] = placed_centre + rng.uniform(-NODE_SPACING, NODE_SPACING, 2)
+                placed[i] = True
+            break
+        pending = [i for i in pending if not placed[i]]
+    return pos
+
+
+def compute_layout(nodes, edges, fixed_node_ids=None, iterations=None, seed=0):
+    """
+    Computes coordinates for device nodes using a vectorized force-directed layout.
+
+    `nodes` and `edges` use the React Flow shape sent by the frontend. Only device
+    nodes (type 'custom', or nodes without a type) take part in the layout.
+
+    When `fixed_node_ids` is None a full layout is computed and the result is shifted
+    so the map starts at (BASE_X, BASE_Y). Otherwise the layout is incremental: the
+    listed nodes keep their current positions and only the remaining nodes are
+    relaxed around them.
+
+    Returns a dict mapping node id to {'x': ..., 'y': ...} (top-left node corner).
+    """
+    device_nodes = [n for n in nodes if n.get('type', 'custom') == 'custom' and n.get('id') is not None]
+    if len(device_nodes) > MAX_LAYOUT_NODES:
+        raise ValueError(f"Layout is limited to {MAX_LAYOUT_NODES} nodes, got {len(device_nodes)}.")
+    if not device_nodes:
+        return {}
+
+    nodes_by_id = {n['id']: n for n in device_nodes}
+    node_ids = list(nodes_by_id)
+    index_of = {node_id: i for i, node_id in enumerate(node_ids)}
+
+    # Collapse parallel and reverse-direction edges into one undirected spring each.
+    pairs = set()
+    for edge in edges:
+        a, b = index_of.get(edge.get('source')), index_of.get(edge.get('target'))
+        if a is None or b is None or a == b:
+            continue
+        pairs.add((min(a, b), max(a, b)))
+    pair_array = np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+    src, dst = pair_array[:, 0], pair_array[:, 1]
+
+    incremental = fixed_node_ids is not None
+    fixed = set(fixed_node_ids or []) & set(node_ids)
+    rng = np.random.default_rng(seed)
+    pos = _initial_positions(node_ids, nodes_by_id, src, dst, fixed if incremental else None, rng)
+
+    if incremental:
+        movable_idx = np.array([i for i, node_id in enumerate(node_ids) if node_id not in fixed], dtype=np.int64)
+        steps = INCREMENTAL_ITERATIONS if iterations is None else iterations
+        start_temperature = NODE_SPACING
+    else:
+        movable_idx = np.arange(len(node_ids))
+        steps = FULL_ITERATIONS if iterations is None else iterations
+        start_temperature = NODE_SPACING * max(1.0, np.sqrt(len(node_ids))) / 4
+
+    if len(movable_idx) > 0 and len(node_ids) > 1:
+        _relax(pos, src, dst, movable_idx, steps, start_temperature, NODE_SPACING)
+
+    if not incremental:
+        pos -= pos.min(axis=0)
+        pos += (BASE_X, BASE_Y)
+
+    return {
+        node_id: {'x': round(float(pos[i, 0]), 1), 'y': round(float(pos[i, 1]), 1)}
+        for i, node_id in enumerate(node_ids)
+    }
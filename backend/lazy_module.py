@@ -0,0 +1,27 @@
+import importlib
+
+
+class LazyModule:
+    """
+    Stands in for a module and imports it on first attribute access, so modules with
+    heavy dependencies (Pillow, NumPy, multiprocessing) stay off the startup path
+    until a request or the background pre-warm actually needs them.
+    `importlib.import_module` holds the import lock, so concurrent first use is safe.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def load(self):
+        """Imports the module now (if it is not loaded yet) and returns it."""
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<LazyModule {self._name!r} ({state})>"
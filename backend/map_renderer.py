@@ -1,6 +1,33 @@
+import hashlib
 import re
 import os
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
 from PIL import Image, ImageDraw
+import node_renderer
+from encoder_profiles import DEFAULT_ENCODER_PROFILE, ENCODER_PROFILES, get_encoder_profile
+
+LINK_COLORS = ['#E6194B', '#3CB44B', '#4363D8', '#F58231', '#911EB4', '#46F0F0', '#FABEBE', '#008080', '#E6BEFF', '#AA6E28']
+LINK_WIDTH = 4
+
+# --- Progressive Rendering Configuration ---
+# The preview is the background reduced by an integer factor until it fits within
+# PREVIEW_MAX_SIZE, with the links drawn on top. PREVIEW_BUDGET_SECONDS starts
+# before the background is decoded; whatever is left of it after decoding is spent
+# on links and devices, and anything that does not fit is skipped and the preview
+# flagged as incomplete. Decoding a large PNG cannot be cut short (only JPEG supports
+# reduced-resolution decoding), so reduced backgrounds are cached by content hash:
+# re-uploads of the same background, the common case while editing, skip the decode.
+# Encoding the two small PNGs afterwards is not part of the budget.
+PREVIEW_MAX_SIZE = 1024
+PREVIEW_BUDGET_SECONDS = 0.5
+PREVIEW_BACKGROUND_CACHE_SIZE = 8
+THUMBNAIL_SIZE = (320, 240)
+
+_preview_backgrounds = OrderedDict()
+_preview_backgrounds_lock = threading.Lock()
 
 def parse_config(config_content):
     """
@@ -14,6 +41,14 @@ def parse_config(config_content):
     if background_match:
         data['background'] = background_match.group(1).strip()
 
+    # Global render hints written by the server-side config generator
+    theme_match = re.search(r'^SET\s+autocacti_theme\s+(\S+)', config_content, re.MULTILINE)
+    if theme_match:
+        data['theme'] = theme_match.group(1)
+    scale_match = re.search(r'^SET\s+autocacti_scale\s+(\d+(?:\.\d+)?)', config_content, re.MULTILINE)
+    if scale_match:
+        data['scale_factor'] = float(scale_match.group(1))
+
     # This robust regex pattern correctly captures multi-line blocks.
     # It reads from a keyword (NODE/LINK) until it sees the next keyword or the end of the file.
     node_pattern = re.compile(r'^NODE\s+(\S+)\n(.*?)(?=^NODE|^LINK|\Z)', re.DOTALL | re.MULTILINE)
@@ -30,6 +65,10 @@ def parse_config(config_content):
         if pos_match:
             node_data['x'] = int(pos_match.group(1))
             node_data['y'] = int(pos_match.group(2))
+
+        # Device icon and label hints written by the server-side config generator
+        for hint_match in re.finditer(r'^\s*SET\s+autocacti_(icon|label|sublabel)\s+(.+?)\s*$', node_body, re.MULTILINE):
+            node_data[hint_match.group(1)] = hint_match.group(2)
         
         if 'x' in node_data and 'y' in node_data:
             data['nodes'][node_id] = node_data
@@ -46,25 +85,77 @@ def parse_config(config_content):
         # Search for the NODES line within the captured block
         nodes_match = re.search(r'^\s*NODES\s+(\S+)\s+(\S+)', link_body, re.MULTILINE)
         if nodes_match:
-            data['links'].append({
+            link_data = {
                 'node1': nodes_match.group(1),
                 'node2': nodes_match.group(2)
-            })
+            }
+            bandwidth_match = re.search(r'^\s*BANDWIDTH\s+(\S+)', link_body, re.MULTILINE)
+            if bandwidth_match:
+                link_data['bandwidth'] = bandwidth_match.group(1)
+            data['links'].append(link_data)
 
     return data
 
-def render_map_from_config(config_path):
+def _draw_links(draw, map_data, scale=1.0, deadline=None):
     """
-    Renders a final map image by drawing the links defined in a .conf file
-    onto the specified background image. Returns a PIL Image object.
+    Draws every link whose two nodes are known, scaling coordinates by `scale`.
+    Returns False if `deadline` (a `time.perf_counter()` value) passed before all
+    links were drawn, True otherwise.
     """
+    width = max(1, round(LINK_WIDTH * scale))
+    color_index = 0
+
+    for link in map_data['links']:
+        if deadline is not None and time.perf_counter() > deadline:
+            return False
+
+        node1_id = link['node1']
+        node2_id = link['node2']
+
+        if node1_id in map_data['nodes'] and node2_id in map_data['nodes']:
+            node1 = map_data['nodes'][node1_id]
+            node2 = map_data['nodes'][node2_id]
+            
+            current_color = LINK_COLORS[color_index % len(LINK_COLORS)]
+            color_index += 1
+            
+            draw.line(
+                [(node1['x'] * scale, node1['y'] * scale), (node2['x'] * scale, node2['y'] * scale)], 
+                fill=current_color, 
+                width=width
+            )
+
+    return True
+
+def load_map_data(config_path):
+    """Reads and parses a .conf file."""
     if not os.path.exists(config_path):
         raise FileNotFoundError(f"Config file not found at {config_path}")
 
     with open(config_path, 'r') as f:
         config_content = f.read()
 
-    map_data = parse_config(config_content)
+    return parse_config(config_content)
+
+def draw_map(image, map_data):
+    """Draws the links, and for server-generated configs the devices, onto an RGBA image in place."""
+    _draw_links(ImageDraw.Draw(image), map_data)
+
+    # Server-generated configs carry the devices, so icons and labels no longer
+    # have to be baked into the uploaded background by the browser.
+    if node_renderer.has_device_nodes(map_data):
+        node_renderer.draw_nodes(image, map_data, theme=map_data.get('theme', 'light'))
+
+def render_map_from_config(config_path, map_data=None):
+    """
+    Renders a final map image by drawing the links defined in a .conf file
+    onto the specified background image. Returns a PIL Image object.
+
+    If `map_data` (in the shape returned by `parse_config`) is supplied, for example
+    by the server-side config generator, the config file is not read or parsed again.
+    """
+    if map_data is None:
+        map_data = load_map_data(config_path)
 
     if not map_data.get('background'):
         raise ValueError("BACKGROUND image path not found in config file.")
@@ -76,38 +167,116 @@ def render_map_from_config(config_path):
         raise FileNotFoundError(f"Background image not found at {background_image_path}")
 
     image = Image.open(background_image_path).convert("RGBA")
-    draw = ImageDraw.Draw(image)
+    draw_map(image, map_data)
+    return image
 
-    LINK_COLORS = ['#E6194B', '#3CB44B', '#4363D8', '#F58231', '#911EB4', '#46F0F0', '#FABEBE', '#008080', '#E6BEFF', '#AA6E28']
-    color_index = 0
+def encode_image(image, output, profile_name=DEFAULT_ENCODER_PROFILE):
+    """
+    Encodes `image` to `output` (a path or file object) using an encoder profile.
+    Palette quantization uses the fast octree quantizer without dithering, which
+    keeps the flat map colors and thin link lines crisp.
+    """
+    profile = get_encoder_profile(profile_name)
+    if profile.get('quantize'):
+        image = image.quantize(colors=profile['quantize'], method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+    image.save(output, profile['format'], **profile['options'])
 
-    for link in map_data['links']:
-        node1_id = link['node1']
-        node2_id = link['node2']
+def render_and_save_map(config_path, output_path, map_data=None, encoder_profile=DEFAULT_ENCODER_PROFILE):
+    """
+    Renders a map from a config file and saves it to a specified path, encoded with
+    the given encoder profile (see ENCODER_PROFILES).
+    """
+    final_image = render_map_from_config(config_path, map_data)
 
-        if node1_id in map_data['nodes'] and node2_id in map_data['nodes']:
-            node1 = map_data['nodes'][node1_id]
-            node2 = map_data['nodes'][node2_id]
-            
-            current_color = LINK_COLORS[color_index % len(LINK_COLORS)]
-            color_index += 1
-            
-            draw.line(
-                [(node1['x'], node1['y']), (node2['x'], node2['y'])], 
-                fill=current_color, 
-                width=4
-            )
+    output_dir = os.path.dirname(output_path)
+    os.makedirs(output_dir, exist_ok=True)
 
-    return image
+    encode_image(final_image, output_path, encoder_profile)
+    print(f"Final map image saved to {output_path}")
 
-def render_and_save_map(config_path, output_path):
+def _reduce_background(background_bytes, max_size):
     """
-    Renders a map from a config file and saves it to a specified path.
+    Decodes a background reduced by an integer factor until it fits within `max_size`.
+    JPEGs are decoded at reduced resolution via `Image.draft`; anything else is decoded
+    fully and shrunk with `Image.reduce`, a fast integer box filter.
+    Returns `(reduced RGBA image, full width)`.
     """
-    final_image = render_map_from_config(config_path)
+    image = Image.open(BytesIO(background_bytes))
+    full_width, full_height = image.size
+    factor = max(1, -(-max(full_width, full_height) // max_size))
 
-    output_dir = os.path.dirname(output_path)
-    os.makedirs(output_dir, exist_ok=True)
+    if factor > 1:
+        image.draft('RGB', (full_width // factor, full_height // factor))
+        remaining = max(1, -(-max(image.size) // max_size))
+        if remaining > 1:
+            image = image.reduce(remaining)
+    return image.convert("RGBA"), full_width
+
+def _get_preview_background(background_bytes, max_size):
+    """Returns `(reduced background, full width, cached)`, decoding only on a cache miss."""
+    key = (hashlib.sha256(background_bytes).hexdigest(), max_size)
+    with _preview_backgrounds_lock:
+        entry = _preview_backgrounds.get(key)
+        if entry is not None:
+            _preview_backgrounds.move_to_end(key)
+            return entry + (True,)
+
+    entry = _reduce_background(background_bytes, max_size)
+    with _preview_backgrounds_lock:
+        _preview_backgrounds[key] = entry
+        while len(_preview_backgrounds) > PREVIEW_BACKGROUND_CACHE_SIZE:
+            _preview_backgrounds.popitem(last=False)
+    return entry + (False,)
+
+def render_preview(background, map_data, max_size=PREVIEW_MAX_SIZE, budget_seconds=PREVIEW_BUDGET_SECONDS):
+    """
+    Quickly renders a downscaled preview of a map straight from the uploaded
+    background (a path or file object) and its parsed `map_data`.
+
+    The budget covers decoding and drawing: links and devices are only drawn while
+    time is left, so a slow first decode yields a partial (possibly link-less)
+    preview rather than a late one. Returns `(preview, thumbnail, info)` where `info`
+    reports the scale, whether everything was drawn, whether the reduced background
+    came from the cache, and the elapsed seconds.
+    """
+    started = time.perf_counter()
+    deadline = started + budget_seconds
+
+    if hasattr(background, 'read'):
+        background_bytes = background.read()
+    else:
+        with open(background, 'rb') as f:
+            background_bytes = f.read()
+
+    reduced, full_width, cached = _get_preview_background(background_bytes, max_size)
+    preview = reduced.copy()
+    scale = preview.size[0] / full_width
+    complete = _draw_links(ImageDraw.Draw(preview), map_data, scale=scale, deadline=deadline)
+    if complete and node_renderer.has_device_nodes(map_data):
+        if time.perf_counter() < deadline:
+            node_renderer.draw_nodes(preview, map_data, scale=scale, theme=map_data.get('theme', 'light'))
+        else:
+            complete = False
+
+    thumbnail = preview.copy()
+    thumbnail.thumbnail(THUMBNAIL_SIZE, reducing_gap=2.0)
+
+    return preview, thumbnail, {
+        'scale': scale,
+        'complete': complete,
+        'cached_background': cached,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+def render_and_save_preview(background, map_data, preview_path, thumbnail_path):
+    """
+    Renders a preview and thumbnail (see `render_preview`) and saves both as quickly
+    encoded PNGs. Returns the preview info dict.
+    """
+    preview, thumbnail, info = render_preview(background, map_data)
+
+    for image, path in ((preview, preview_path), (thumbnail, thumbnail_path)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        image.save(path, 'PNG', compress_level=1)
 
-    final_image.save(output_path, 'PNG')
-    print(f"Final map image saved to {output_path}")
\ No newline at end of file
+    return info
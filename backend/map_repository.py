@@ -0,0 +1,307 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# --- Map Repository Configuration ---
+# Saved map documents (the JSON exported by `mapImportExportService.js`) are versioned
+# here. Each revision stores a delta against the previous one, keyed by node and edge
+# ID, and every SNAPSHOT_INTERVAL revisions the full document is stored as well, so a
+# checkout never has to replay more than SNAPSHOT_INTERVAL - 1 deltas.
+INDEX_PATH = os.path.join('instance', 'maps.sqlite3')
+SNAPSHOT_INTERVAL = 25
+COMPRESSION_LEVEL = 6
+# Recently checked out documents, so saving against the head does not rebuild it.
+DOCUMENT_CACHE_SIZE = 16
+
+# Top-level keys holding lists of ID'd items; everything else is versioned as metadata.
+COLLECTIONS = ('nodes', 'edges')
+
+_lock = threading.Lock()
+_document_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class RevisionConflict(Exception):
+    """Raised when a save is based on a revision that is no longer the head."""
+
+
+@contextmanager
+def _connect():
+    """Opens the repository, commits on success, and always closes the connection."""
+    conn = sqlite3.connect(INDEX_PATH, timeout=30)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def init_repository():
+    """Creates the SQLite repository if it does not exist yet."""
+    os.makedirs(os.path.dirname(INDEX_PATH), exist_ok=True)
+    with _lock, _connect() as conn:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS maps (
+                name TEXT PRIMARY KEY,
+                head INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS revisions (
+                map_name TEXT NOT NULL,
+                rev INTEGER NOT NULL,
+                delta BLOB NOT NULL,
+                snapshot BLOB,
+                stored_bytes INTEGER NOT NULL,
+                author TEXT,
+                message TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (map_name, rev)
+            );
+        """)
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+def _index(items, collection):
+    indexed = OrderedDict()
+    for item in items:
+        if not isinstance(item, dict) or 'id' not in item:
+            raise ValueError(f"Every item in '{collection}' needs an 'id'")
+        indexed[str(item['id'])] = item
+    return indexed
+
+
+def _check_ids(document):
+    """Rejects documents whose nodes or edges repeat an ID, which could not round-trip through deltas."""
+    for collection in COLLECTIONS:
+        seen = set()
+        for item in document.get(collection) or []:
+            key = str(item['id']) if isinstance(item, dict) and 'id' in item else None
+            if key is None:
+                raise ValueError(f"Every item in '{collection}' needs an 'id'")
+            if key in seen:
+                raise ValueError(f"Duplicate id '{key}' in '{collection}'")
+            seen.add(key)
+
+
+def _diff_mapping(old, new):
+    delta = {'added': {}, 'changed': {}, 'removed': []}
+    for key, value in new.items():
+        if key not in old:
+            delta['added'][key] = value
+        elif old[key] != value:
+            delta['changed'][key] = value
+    delta['removed'] = [key for key in old if key not in new]
+    return delta
+
+
+def diff_documents(old, new):
+    """
+    Returns the delta that turns document `old` into `new`: for `nodes`, `edges` and
+    the remaining top-level `meta` keys, the items that were added, changed (with their
+    new value) or removed. A collection whose order changed beyond appending and
+    removing items also carries its new ID `order`.
+    """
+    delta = {}
+    for collection in COLLECTIONS:
+        old_items = _index(old.get(collection) or [], collection)
+        new_items = _index(new.get(collection) or [], collection)
+        delta[collection] = _diff_mapping(old_items, new_items)
+
+        removed = set(delta[collection]['removed'])
+        expected_order = [key for key in old_items if key not in removed]
+        expected_order += [key for key in new_items if key not in old_items]
+        if expected_order != list(new_items):
+            delta[collection]['order'] = list(new_items)
+
+    old_meta = {key: value for key, value in old.items() if key not in COLLECTIONS}
+    new_meta = {key: value for key, value in new.items() if key not in COLLECTIONS}
+    delta['meta'] = _diff_mapping(old_meta, new_meta)
+    return delta
+
+
+def is_empty_delta(delta):
+    return not any(part['added'] or part['changed'] or part['removed'] or part.get('order')
+                   for part in delta.values())
+
+
+def apply_deltas(document, deltas):
+    """
+    Returns a new document with `deltas` applied in order; `document` itself is not
+    modified. The collections are indexed by ID once for the whole replay.
+    """
+    meta = {key: value for key, value in document.items() if key not in COLLECTIONS}
+    collections = {collection: _index(document.get(collection) or [], collection) for collection in COLLECTIONS}
+
+    for delta in deltas:
+        for key in delta['meta']['removed']:
+            meta.pop(key, None)
+        meta.update(delta['meta']['changed'])
+        meta.update(delta['meta']['added'])
+
+        for collection, items in collections.items():
+            part = delta[collection]
+            for key in part['removed']:
+                items.pop(key, None)
+            items.update(part['changed'])
+            items.update(part['added'])
+            if part.get('order'):
+                collections[collection] = OrderedDict((key, items[key]) for key in part['order'])
+
+    result = dict(meta)
+    for collection, items in collections.items():
+        result[collection] = list(items.values())
+    return result
+
+
+def _cache_get(map_name, rev):
+    with _cache_lock:
+        document = _document_cache.get((map_name, rev))
+        if document is not None:
+            _document_cache.move_to_end((map_name, rev))
+        return document
+
+
+def _cache_put(map_name, rev, document):
+    with _cache_lock:
+        _document_cache[(map_name, rev)] = document
+        _document_cache.move_to_end((map_name, rev))
+        while len(_document_cache) > DOCUMENT_CACHE_SIZE:
+            _document_cache.popitem(last=False)
+
+
+def get_head(map_name):
+    """Returns the latest revision number of a map, or None if it was never saved."""
+    with _connect() as conn:
+        row = conn.execute("SELECT head FROM maps WHERE name = ?", (map_name,)).fetchone()
+    return row[0] if row else None
+
+
+def checkout(map_name, rev):
+    """
+    Rebuilds the document as of revision `rev` from the nearest snapshot at or before
+    it plus the deltas after that. Raises LookupError if the revision does not exist.
+    Returned documents are shared with the cache and must not be modified.
+    """
+    document = _cache_get(map_name, rev)
+    if document is not None:
+        return document
+
+    with _connect() as conn:
+        base = conn.execute(
+            "SELECT rev, snapshot FROM revisions WHERE map_name = ? AND rev <= ? AND snapshot IS NOT NULL "
+            "ORDER BY rev DESC LIMIT 1",
+            (map_name, rev)
+        ).fetchone()
+        if base is None or not conn.execute(
+                "SELECT 1 FROM revisions WHERE map_name = ? AND rev = ?", (map_name, rev)).fetchone():
+            raise LookupError(f"Revision {rev} of map '{map_name}' not found")
+        deltas = conn.execute(
+            "SELECT delta FROM revisions WHERE map_name = ? AND rev > ? AND rev <= ? ORDER BY rev",
+            (map_name, base[0], rev)
+        ).fetchall()
+
+    document = apply_deltas(_unpack(base[1]), [_unpack(blob) for (blob,) in deltas])
+    _cache_put(map_name, rev, document)
+    return document
+
+
+def save_revision(map_name, document, author=None, message=None, base_revision=None):
+    """
+    Stores `document` as the next revision of `map_name`.
+
+    Only the delta against the current head is stored, plus a full snapshot on the
+    first revision and every SNAPSHOT_INTERVAL revisions after it. If `base_revision`
+    (the revision the editor started from, 0 for a new map) is given and is no longer
+    the head, or another process saves first, RevisionConflict is raised so the
+    caller can reload and retry. Duplicate node or edge IDs raise ValueError.
+    A save without any changes creates no revision. Returns a summary dict.
+    """
+    if not isinstance(document, dict):
+        raise ValueError("The map document must be a JSON object")
+    _check_ids(document)
+
+    with _lock:
+        head = get_head(map_name)
+        if base_revision is not None and base_revision != (head or 0):
+            raise RevisionConflict(f"Map '{map_name}' is at revision {head}, not {base_revision}")
+
+        previous = checkout(map_name, head) if head else {}
+        delta = diff_documents(previous, document)
+        changes = {part: {kind: len(delta[part][kind]) for kind in ('added', 'changed', 'removed')}
+                   for part in delta}
+        if head and is_empty_delta(delta):
+            return {'map_name': map_name, 'revision': head, 'created': False, 'changes': changes}
+
+        rev = (head or 0) + 1
+        delta_blob = _pack(delta)
+        snapshot_blob = _pack(document) if (rev - 1) % SNAPSHOT_INTERVAL == 0 else None
+        stored_bytes = len(delta_blob) + (len(snapshot_blob) if snapshot_blob else 0)
+        now = time.time()
+
+        try:
+            with _connect() as conn:
+                conn.execute(
+                    "INSERT INTO revisions (map_name, rev, delta, snapshot, stored_bytes, author, message, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (map_name, rev, delta_blob, snapshot_blob, stored_bytes, author, message, now)
+                )
+                conn.execute(
+                    "INSERT INTO maps (name, head, created_at, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET head = excluded.head, updated_at = excluded.updated_at",
+                    (map_name, rev, now, now)
+                )
+        except sqlite3.IntegrityError:
+            # Another worker process saved revision `rev` first; `_lock` only serializes
+            # saves within this process.
+            raise RevisionConflict(f"Map '{map_name}' was saved concurrently; revision {rev} already exists")
+        _cache_put(map_name, rev, document)
+
+    return {
+        'map_name': map_name,
+        'revision': rev,
+        'created': True,
+        'snapshot': snapshot_blob is not None,
+        'stored_bytes': stored_bytes,
+        'changes': changes,
+    }
+
+
+def list_revisions(map_name):
+    """Returns the revision history of a map, newest first, or None for an unknown map."""
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT rev, snapshot IS NOT NULL, stored_bytes, author, message, created_at FROM revisions "
+            "WHERE map_name = ? ORDER BY rev DESC",
+            (map_name,)
+        ).fetchall()
+    if not rows:
+        return None
+    return [
+        {'revision': rev, 'snapshot': bool(snapshot), 'stored_bytes': stored_bytes,
+         'author': author, 'message': message, 'created_at': created_at}
+        for rev, snapshot, stored_bytes, author, message, created_at in rows
+    ]
+
+
+def diff_revisions(map_name, from_rev, to_rev):
+    """
+    Returns what changed between two revisions, in the same shape as `diff_documents`.
+
+    Both revisions are checked out and compared, so an item that was edited and then
+    edited back in between (or removed and re-added unchanged) is not reported, and
+    both directions agree. Raises LookupError if either revision does not exist.
+    """
+    return diff_documents(checkout(map_name, from_rev), checkout(map_name, to_rev))
@@ -0,0 +1,166 @@
+import math
+import os
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+
+# --- Node Rendering Configuration ---
+# Copies of `frontend/src/assets/icons`, so server renders match the editor without
+# the frontend tree being deployed alongside; update both together. AUTOCACTI_ICONS_DIR
+# points the renderer at another icon set.
+ICONS_DIR = (os.environ.get('AUTOCACTI_ICONS_DIR')
+             or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'icons'))
+
+# Mirrors ICONS_BY_THEME in `frontend/src/config/constants.js`.
+ICONS_BY_THEME = {
+    'Router': {'light': 'router-black.png', 'dark': 'router-white.png'},
+    'Switch': {'light': 'switch-black.png', 'dark': 'switch-white.png'},
+    'Firewall': {'light': 'firewall.png', 'dark': 'firewall.png'},
+    'Encryptor': {'light': 'encryptor-black.png', 'dark': 'encryptor-white.png'},
+    'Unknown': {'light': 'firewall.png', 'dark': 'firewall.png'},
+}
+
+LABEL_COLORS = {
+    'light': {'primary': (33, 37, 41, 255), 'secondary': (108, 117, 125, 255)},
+    'dark': {'primary': (228, 230, 235, 255), 'secondary': (176, 179, 184, 255)},
+}
+
+# Sizes at scale 1.0, matching the `.node-icon` and `.node-label` styles in App.css.
+ICON_SIZE = 40
+HOSTNAME_FONT_SIZE = 16
+SUBLABEL_FONT_SIZE = 13
+BANDWIDTH_FONT_SIZE = 11
+LABEL_GAP = 4
+FONT_NAME = 'DejaVuSans.ttf'
+
+# Upper bound on distinct cached label bitmaps (text, size, color).
+LABEL_CACHE_SIZE = 16384
+
+
+@lru_cache(maxsize=None)
+def get_sprite_atlas(icon_size, theme):
+    """
+    Decodes every device icon once, fits it into an `icon_size` square and packs all
+    of them into a single RGBA strip. Returns `(atlas, boxes)` where `boxes` maps a
+    device type to its source box in the atlas.
+    """
+    icon_files = {icon_type: files.get(theme, files['light']) for icon_type, files in ICONS_BY_THEME.items()}
+    decoded = {}
+    for filename in set(icon_files.values()):
+        with Image.open(os.path.join(ICONS_DIR, filename)) as icon:
+            icon = icon.convert('RGBA')
+            icon.thumbnail((icon_size, icon_size), Image.LANCZOS)
+            # Centre inside a square cell so every sprite has the same footprint.
+            cell = Image.new('RGBA', (icon_size, icon_size), (0, 0, 0, 0))
+            cell.paste(icon, ((icon_size - icon.width) // 2, (icon_size - icon.height) // 2))
+            decoded[filename] = cell
+
+    filenames = sorted(decoded)
+    atlas = Image.new('RGBA', (icon_size * len(filenames), icon_size), (0, 0, 0, 0))
+    offsets = {}
+    for i, filename in enumerate(filenames):
+        atlas.paste(decoded[filename], (i * icon_size, 0))
+        offsets[filename] = (i * icon_size, 0, (i + 1) * icon_size, icon_size)
+
+    boxes = {icon_type: offsets[filename] for icon_type, filename in icon_files.items()}
+    return atlas, boxes
+
+
+@lru_cache(maxsize=None)
+def _font(size):
+    try:
+        return ImageFont.truetype(FONT_NAME, size)
+    except OSError:
+        return ImageFont.load_default(size)
+
+
+@lru_cache(maxsize=None)
+def _glyph(char, size):
+    """Rasterizes a single character once as an 'L' coverage mask, with its advance width."""
+    font = _font(size)
+    ascent, descent = font.getmetrics()
+    right = font.getbbox(char)[2]
+    mask = Image.new('L', (max(1, right), ascent + descent))
+    ImageDraw.Draw(mask).text((0, 0), char, font=font, fill=255)
+    return mask, font.getlength(char)
+
+
+@lru_cache(maxsize=LABEL_CACHE_SIZE)
+def get_text_bitmap(text, size, color):
+    """
+    Returns an RGBA bitmap of a label. Labels are assembled from cached glyph masks
+    instead of running the font rasterizer per label, and the finished bitmap is
+    cached too, so repeated labels (bandwidths, re-renders of the same map) are
+    just composited.
+    """
+    glyphs = [_glyph(char, size) for char in text] or [_glyph(' ', size)]
+    width = math.ceil(sum(advance for _, advance in glyphs)) + 2
+    mask = Image.new('L', (width, glyphs[0][0].height))
+
+    x = 0.0
+    for glyph_mask, advance in glyphs:
+        mask.paste(255, (int(round(x)), 0), glyph_mask)
+        x += advance
+
+    bitmap = Image.new('RGBA', mask.size, color)
+    bitmap.putalpha(mask)
+    return bitmap
+
+
+def _paste_centered(image, bitmap, cx, top):
+    x = int(round(cx - bitmap.width / 2))
+    y = int(round(top))
+    # alpha_composite requires the destination to lie inside the image.
+    if x < 0 or y < 0 or x + bitmap.width > image.width or y + bitmap.height > image.height:
+        return
+    image.alpha_composite(bitmap, (x, y))
+
+
+def has_device_nodes(map_data):
+    """True if the map data carries device nodes (only server-generated configs do)."""
+    return any('icon' in node for node in map_data['nodes'].values())
+
+
+def draw_nodes(image, map_data, scale=1.0, theme='light'):
+    """
+    Draws device icons with hostname/IP labels, plus bandwidth labels at link midpoints,
+    onto an RGBA `image`. Node coordinates in `map_data` are icon centres at scale 1.0.
+    Coordinates are already multiplied by the export's `scale_factor` (the browser's
+    device pixel ratio), so only the icon and label sizes are scaled by it here.
+    """
+    colors = LABEL_COLORS.get(theme, LABEL_COLORS['light'])
+    size_scale = scale * map_data.get('scale_factor', 1)
+    icon_size = max(4, round(ICON_SIZE * size_scale))
+    atlas, boxes = get_sprite_atlas(icon_size, theme)
+    hostname_size = max(6, round(HOSTNAME_FONT_SIZE * size_scale))
+    sublabel_size = max(6, round(SUBLABEL_FONT_SIZE * size_scale))
+    bandwidth_size = max(6, round(BANDWIDTH_FONT_SIZE * size_scale))
+    gap = LABEL_GAP * size_scale
+
+    nodes = map_data['nodes']
+    for link in map_data['links']:
+        bandwidth = link.get('bandwidth')
+        node1, node2 = nodes.get(link['node1']), nodes.get(link['node2'])
+        if bandwidth and node1 and node2:
+            bitmap = get_text_bitmap(bandwidth, bandwidth_size, colors['secondary'])
+            cx = (node1['x'] + node2['x']) / 2 * scale
+            cy = (node1['y'] + node2['y']) / 2 * scale
+            # Sit just above the line so the label does not hide the link colour.
+            _paste_centered(image, bitmap, cx, cy - bitmap.height - gap)
+
+    for node in nodes.values():
+        if 'icon' not in node:
+            continue
+        cx, cy = node['x'] * scale, node['y'] * scale
+
+        box = boxes.get(node['icon'], boxes['Unknown'])
+        x, y = int(round(cx - icon_size / 2)), int(round(cy - icon_size))
+        if 0 <= x and 0 <= y and x + icon_size <= image.width and y + icon_size <= image.height:
+            image.alpha_composite(atlas, (x, y), box)
+
+        top = cy + gap
+        if node.get('label'):
+            bitmap = get_text_bitmap(node['label'], hostname_size, colors['primary'])
+            _paste_centered(image, bitmap, cx, top)
+            top += bitmap.height + gap
+        if node.get('sublabel'):
+            _paste_centered(image, get_text_bitmap(node['sublabel'], sublabel_size, colors['secondary']), cx, top)
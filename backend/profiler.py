@@ -0,0 +1,148 @@
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- Profiler Configuration ---
+# Profiling is opt-in per request or task, and off unless AUTOCACTI_PROFILING=1:
+# profiles expose server file paths, so production servers refuse profile requests
+# and the /debug/profiles endpoints by default. Nothing here runs unless a caller
+# asks for a profile, so a disabled profiler costs one flag check.
+PROFILING_ENABLED = os.environ.get('AUTOCACTI_PROFILING', '0') == '1'
+SAMPLE_INTERVAL_SECONDS = 0.005
+# A forgotten profile stops sampling after this long, even if the code keeps running.
+MAX_PROFILE_SECONDS = 300
+MAX_STORED_PROFILES = 50
+
+# Finished and running profiles, keyed by profile ID, oldest first.
+PROFILES = {}
+_profiles_lock = threading.Lock()
+_active = threading.local()
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame):
+    """Formats a stack as a collapsed, root-first `a;b;c` line, as used by flamegraph tools."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+@contextmanager
+def sampling(thread_ident=None, interval=SAMPLE_INTERVAL_SECONDS):
+    """
+    Samples the stack of one thread (the calling thread by default) from a helper
+    thread every `interval` seconds while the block runs. Yields a Counter that maps
+    collapsed stacks to sample counts and is complete once the block exits.
+    """
+    thread_ident = thread_ident or threading.get_ident()
+    stacks = Counter()
+    stop = threading.Event()
+    deadline = time.perf_counter() + MAX_PROFILE_SECONDS
+
+    def sample():
+        while not stop.wait(interval) and time.perf_counter() < deadline:
+            frame = sys._current_frames().get(thread_ident)
+            if frame is None:
+                break
+            stacks[_collapse(frame)] += 1
+            del frame
+
+    sampler = threading.Thread(target=sample, name='profiler-sampler', daemon=True)
+    sampler.start()
+    try:
+        yield stacks
+    finally:
+        stop.set()
+        sampler.join()
+
+
+def current_profile_id():
+    """The ID of the profile the calling thread is running under, or None."""
+    return getattr(_active, 'profile_id', None)
+
+
+@contextmanager
+def profiled(kind, label):
+    """
+    Runs the block under the sampling profiler and stores the result in PROFILES.
+    Yields the profile record, whose `id` can be handed out before the block ends.
+    """
+    profile_id = uuid.uuid4().hex
+    record = {
+        'id': profile_id,
+        'kind': kind,
+        'label': label,
+        'status': 'RUNNING',
+        'interval_seconds': SAMPLE_INTERVAL_SECONDS,
+        'started_at': datetime.utcnow().isoformat(),
+        'duration_seconds': None,
+        'samples': 0,
+        'stacks': {},
+    }
+    with _profiles_lock:
+        PROFILES[profile_id] = record
+        while len(PROFILES) > MAX_STORED_PROFILES:
+            del PROFILES[next(iter(PROFILES))]
+
+    _active.profile_id = profile_id
+    started = time.perf_counter()
+    stacks = Counter()
+    try:
+        with sampling() as stacks:
+            yield record
+    finally:
+        _active.profile_id = None
+        with _profiles_lock:
+            for stack, count in stacks.items():
+                record['stacks'][stack] = record['stacks'].get(stack, 0) + count
+            record.update({
+                'status': 'COMPLETE',
+                'duration_seconds': round(time.perf_counter() - started, 3),
+                'samples': sum(record['stacks'].values()),
+            })
+
+
+def add_stacks(profile_id, stacks, prefix):
+    """
+    Merges stacks sampled elsewhere (e.g. in a render worker process) into a profile,
+    rooted under `prefix` so they show up as their own tower in a flamegraph.
+    """
+    with _profiles_lock:
+        record = PROFILES.get(profile_id)
+        if record is None:
+            return
+        for stack, count in stacks.items():
+            key = f"{prefix};{stack}"
+            record['stacks'][key] = record['stacks'].get(key, 0) + count
+        record['samples'] = sum(record['stacks'].values())
+
+
+def get_profile(profile_id):
+    """Returns a copy of a stored profile, or None."""
+    with _profiles_lock:
+        record = PROFILES.get(profile_id)
+        return dict(record, stacks=dict(record['stacks'])) if record else None
+
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first, without their stacks."""
+    with _profiles_lock:
+        return [{key: value for key, value in record.items() if key != 'stacks'}
+                for record in reversed(PROFILES.values())]
+
+
+def format_collapsed(profile):
+    """Renders a profile as collapsed-stack text (`stack count` per line), heaviest first."""
+    stacks = sorted(profile['stacks'].items(), key=lambda item: item[1], reverse=True)
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks)
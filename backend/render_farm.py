@@ -0,0 +1,236 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from PIL import Image
+
+import map_renderer
+import profiler
+
+# --- Render Farm Configuration ---
+# 'thread' renders inside the task thread (the original behaviour). 'process' hands
+# the CPU-bound draw and encode to a pool of worker processes so group renders use
+# every core instead of serializing on the GIL alongside request handling.
+RENDER_BACKEND = os.environ.get('RENDER_BACKEND', 'thread')
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', os.cpu_count() or 1))
+
+# Decoded backgrounds stay in shared memory for this long after their last render,
+# so the installations of a group (rendered one after another by separate tasks)
+# and re-renders of the same map reuse one decode instead of each decoding again.
+SHARED_BACKGROUND_TTL_SECONDS = 120
+SHARED_BACKGROUND_MAX_IDLE = 8
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Backgrounds decoded (or being decoded) into shared memory, keyed by artifact hash.
+# Each entry holds the decode `future`, its reference count, and when it became idle.
+_shared_backgrounds = {}
+_shared_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 'spawn' avoids forking a multi-threaded Flask process.
+            _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _run_in_pool(fn, *args):
+    """
+    Runs `fn(*args)` in the worker pool and returns its result. If a worker died and
+    broke the pool, the pool is replaced and the job retried once, so one crash does
+    not fail every later render.
+    """
+    global _pool
+    for attempt in range(2):
+        pool = _get_pool()
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            with _pool_lock:
+                if _pool is pool:
+                    _pool = None
+            pool.shutdown(wait=False)
+            print("Render worker pool broke; starting a new one")
+            if attempt:
+                raise
+
+
+def _decode_background(background_path):
+    """
+    Worker-process entry point. Decodes a background into a new shared memory segment
+    as raw RGBA and returns its descriptor. The segment outlives this handle; the
+    parent unlinks it when it is evicted.
+    """
+    with Image.open(background_path) as image:
+        image = image.convert('RGBA')
+        raw = image.tobytes()
+    shm = shared_memory.SharedMemory(create=True, size=len(raw))
+    try:
+        shm.buf[:len(raw)] = raw
+    finally:
+        shm.close()
+    return {'name': shm.name, 'size': image.size}
+
+
+def _unlink_shared(descriptor):
+    try:
+        shm = shared_memory.SharedMemory(name=descriptor['name'])
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def _evict_idle_backgrounds(now):
+    """Frees idle backgrounds past their TTL, and the oldest idle ones beyond the limit. Needs `_shared_lock`."""
+    idle = sorted((entry['idle_since'], background_hash) for background_hash, entry in _shared_backgrounds.items()
+                  if entry['refs'] == 0)
+    excess = len(idle) - SHARED_BACKGROUND_MAX_IDLE
+    for i, (idle_since, background_hash) in enumerate(idle):
+        if i < excess or now - idle_since > SHARED_BACKGROUND_TTL_SECONDS:
+            entry = _shared_backgrounds.pop(background_hash)
+            _unlink_shared(entry['future'].result())
+
+
+def acquire_background(background_hash, background_path):
+    """
+    Returns a small picklable descriptor of the background decoded into shared memory
+    as raw RGBA. The decode runs once per distinct artifact, in a worker process, and
+    is kept for SHARED_BACKGROUND_TTL_SECONDS after its last use. Every call must be
+    paired with `release_background`.
+    """
+    with _shared_lock:
+        _evict_idle_backgrounds(time.time())
+        entry = _shared_backgrounds.get(background_hash)
+        if entry is None:
+            entry = _shared_backgrounds[background_hash] = {'future': Future(), 'refs': 0, 'idle_since': None}
+            decoder = True
+        else:
+            decoder = False
+        entry['refs'] += 1
+
+    if decoder:
+        # Decoded outside the lock so other backgrounds are not held up; concurrent
+        # callers for the same background wait on the future instead of decoding again.
+        try:
+            entry['future'].set_result(_run_in_pool(_decode_background, os.path.abspath(background_path)))
+        except Exception as e:
+            with _shared_lock:
+                _shared_backgrounds.pop(background_hash, None)
+            entry['future'].set_exception(e)
+    try:
+        return entry['future'].result()
+    except Exception:
+        release_background(background_hash)
+        raise
+
+
+def release_background(background_hash):
+    """Drops one reference to a shared background; it is freed once idle past its TTL."""
+    with _shared_lock:
+        entry = _shared_backgrounds.get(background_hash)
+        if entry is None:
+            return
+        entry['refs'] -= 1
+        if entry['refs'] <= 0:
+            entry['refs'] = 0
+            entry['idle_since'] = time.time()
+        _evict_idle_backgrounds(time.time())
+
+
+def release_all_backgrounds():
+    """Frees every shared background, e.g. on shutdown."""
+    with _shared_lock:
+        for entry in _shared_backgrounds.values():
+            if entry['future'].done() and not entry['future'].exception():
+                _unlink_shared(entry['future'].result())
+        _shared_backgrounds.clear()
+
+
+def _render_job(background, config_path, map_data, output_path, encoder_profile, profile=False):
+    """
+    Worker-process entry point. Attaches to the shared background, so no worker decodes
+    it again, and draws onto a private copy of its pixels (a plain memory copy; the
+    shared pixels must stay untouched for other renders), then encodes straight to
+    `output_path`.
+    With `profile` set, the job is sampled inside the worker and its collapsed stacks
+    are returned under 'stacks'.
+    """
+    if profile:
+        with profiler.sampling() as stacks:
+            result = _render_job(background, config_path, map_data, output_path, encoder_profile)
+        result['stacks'] = dict(stacks)
+        return result
+
+    started = time.perf_counter()
+    # Workers share the parent's resource tracker, so attaching here does not register
+    # a second owner; the parent unlinks the segment when it evicts the background.
+    shm = shared_memory.SharedMemory(name=background['name'])
+    try:
+        if map_data is None:
+            map_data = map_renderer.load_map_data(config_path)
+
+        shared = Image.frombuffer('RGBA', tuple(background['size']), shm.buf, 'raw', 'RGBA', 0, 1)
+        image = shared.copy()
+        del shared
+        attached = time.perf_counter()
+
+        map_renderer.draw_map(image, map_data)
+        drawn = time.perf_counter()
+
+        map_renderer.encode_image(image, output_path, encoder_profile)
+        encoded = time.perf_counter()
+    finally:
+        shm.close()
+
+    return {
+        'output_path': output_path,
+        'pid': os.getpid(),
+        'timings': {
+            'attach': attached - started,
+            'draw': drawn - attached,
+            'encode': encoded - drawn,
+        }
+    }
+
+
+def render_map(background_hash, background_path, config_path, output_path, map_data=None,
+               encoder_profile=map_renderer.DEFAULT_ENCODER_PROFILE):
+    """
+    Renders a map with the configured backend and writes it to `output_path`.
+    With the 'process' backend the background decode, draw and encode all run in
+    worker processes, and the calling thread only waits on them.
+    Returns a dict describing where the work ran and how long each stage took.
+    """
+    if RENDER_BACKEND != 'process':
+        started = time.perf_counter()
+        map_renderer.render_and_save_map(config_path, output_path, map_data, encoder_profile)
+        return {'output_path': output_path, 'backend': 'thread', 'timings': {'total': time.perf_counter() - started}}
+
+    # The caller's sampler cannot see into the worker, so a profiled caller has the
+    # worker sample itself and the stacks are merged into the caller's profile.
+    profile_id = profiler.current_profile_id()
+    background = acquire_background(background_hash, background_path)
+    try:
+        result = _run_in_pool(
+            _render_job, background, os.path.abspath(config_path), map_data,
+            os.path.abspath(output_path), encoder_profile, profile_id is not None
+        )
+    finally:
+        release_background(background_hash)
+
+    if 'stacks' in result:
+        profiler.add_stacks(profile_id, result.pop('stacks'), f"render_worker (pid {result['pid']})")
+    result['backend'] = 'process'
+    return result
+
+
+atexit.register(release_all_backgrounds)
@@ -1,13 +1,29 @@
+import base64
 import os
-import uuid
 import re
-from PIL import Image
+import threading
+import uuid
+import zipfile
 from werkzeug.security import check_password_hash
 import time
 from datetime import datetime
-import map_renderer
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import config_generator
+import encoder_profiles
+import artifact_store
+import profiler
+import change_detector
+from lazy_module import LazyModule
 import random
 
+# The renderer, the render farm and Pillow pull in image codecs and multiprocessing;
+# they are loaded on first use so that importing this module stays cheap at worker startup.
+map_renderer = LazyModule('map_renderer')
+render_farm = LazyModule('render_farm')
+Image = LazyModule('PIL.Image')
+
 # --- Mock Authentication Data ---
 # In a real application, this would be replaced with a proper database
 # and secure password management. The password 'admin' is hashed.
@@ -20,6 +36,25 @@ MOCK_USERS = {
 # --- Mock Task Queue ---
 # In a real application, this would be managed by a system like Celery and Redis.
 MOCK_TASKS = {}
+# Bulk render jobs submitted as a single archive, keyed by batch ID.
+MOCK_BATCHES = {}
+_BATCHES_LOCK = threading.Lock()
+
+# --- Bulk Job Limits ---
+BULK_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+BULK_MAX_MAPS = 2000
+BULK_MAX_CONFIG_BYTES = 5 * 1024 * 1024
+BULK_MAX_BACKGROUND_BYTES = 256 * 1024 * 1024
+
+# --- Neighbor Paging ---
+# A paged neighbor listing walks the device once and serves every later page from
+# that snapshot, so pages stay consistent and SNMP is not re-polled per page.
+NEIGHBOR_PAGE_SIZE = 100
+NEIGHBOR_MAX_PAGE_SIZE = 1000
+NEIGHBOR_SNAPSHOT_TTL_SECONDS = 5 * 60
+_NEIGHBOR_SNAPSHOTS = {}
+_NEIGHBOR_SNAPSHOTS_LOCK = threading.Lock()
+BANDWIDTH_UNITS = {'': 1, 'K': 10**3, 'M': 10**6, 'G': 10**9, 'T': 10**12}
 
 
 def verify_user(username, password):
@@ -303,11 +338,14 @@ MOCK_CACTI_INSTALLATIONS_DB = {
     }
 }
 
-# The new grouped structure that the API will return.
+# The new grouped structure that the API will return. `encoder_profile` names an entry
+# of `encoder_profiles.ENCODER_PROFILES` for the group's rendered maps; a single
+# upload can still override it with the `encoder_profile` form field.
 MOCK_CACTI_GROUPS = [
     {
         "id": 1,
         "name": "Main-Cacti-Group",
+        "encoder_profile": "png",
         "installations": [
             MOCK_CACTI_INSTALLATIONS_DB[3],
             MOCK_CACTI_INSTALLATIONS_DB[4]
@@ -316,6 +354,8 @@ MOCK_CACTI_GROUPS = [
     {
         "id": 2,
         "name": "Legacy-Group",
+        # Lossless like 'png'; encodes about 30% faster for files about 35% larger.
+        "encoder_profile": "png-fast",
         "installations": [
             MOCK_CACTI_INSTALLATIONS_DB[1],
             MOCK_CACTI_INSTALLATIONS_DB[2]
@@ -334,6 +374,20 @@ def get_installations_by_group_id(group_id):
             return group['installations']
     return None
 
+def get_group_encoder_profile(group_id):
+    """Returns the output encoder profile configured for a Cacti group."""
+    for group in MOCK_CACTI_GROUPS:
+        if group['id'] == group_id:
+            return group.get('encoder_profile', encoder_profiles.DEFAULT_ENCODER_PROFILE)
+    return encoder_profiles.DEFAULT_ENCODER_PROFILE
+
+def get_installation_encoder_profile(hostname):
+    """Returns the encoder profile of the first group that contains the installation."""
+    for group in MOCK_CACTI_GROUPS:
+        if any(installation['hostname'] == hostname for installation in group['installations']):
+            return group.get('encoder_profile', encoder_profiles.DEFAULT_ENCODER_PROFILE)
+    return encoder_profiles.DEFAULT_ENCODER_PROFILE
+
 def get_device_info(ip_address):
     """Fetches device type, model, and hostname by IP address."""
     time.sleep(random.uniform(0.3, 1.2)) # Simulate network latency
@@ -357,54 +411,232 @@ def get_device_neighbors(ip_address):
         return {"neighbors": MOCK_NEIGHBORS[ip_address]}
     return None
 
-def save_uploaded_map(map_image_file, config_content, map_name):
-    """Saves the uploaded map image and config file to the designated folders."""
-    # Ensure directories exist
-    maps_dir = "static/maps"
-    configs_dir = "static/configs"
-    os.makedirs(maps_dir, exist_ok=True)
-    os.makedirs(configs_dir, exist_ok=True)
-
-    # Generate a unique filename to prevent overwrites and save the files
-    unique_id = uuid.uuid4()
-    
-    # Save Image
-    image_filename = f"{map_name}_{unique_id}.png"
-    image_path = os.path.join(maps_dir, image_filename)
-    
-    # Handle both FileStorage and in-memory BytesIO objects
-    image_stream = getattr(map_image_file, 'stream', map_image_file)
-    image = Image.open(image_stream)
-    image.save(image_path)
-    
-    # --- MODIFICATION ---
-    # The config file needs to point to the *actual* image file we just saved.
-    # We will replace the placeholder BACKGROUND line with the correct relative path.
-    # This path is relative from the config file's location (`static/configs`) 
-    # to the image's location (`static/maps`).
-    cacti_image_path = f"../maps/{image_filename}"
-    modified_config_content = re.sub(
+def parse_bandwidth(value):
+    """
+    Converts a bandwidth such as '10G', '100M' or '1.5 Gbps' to bits per second.
+    Returns None if the value cannot be parsed.
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:b(?:ps|its)?)?\s*', str(value or ''), flags=re.IGNORECASE)
+    if not match:
+        return None
+    return float(match.group(1)) * BANDWIDTH_UNITS[match.group(2).upper()]
+
+def get_neighbor_device_type(neighbor):
+    """Looks up a neighbor's device type in the inventory, 'Unknown' if it is not known."""
+    return MOCK_NETWORK.get(neighbor.get('ip'), {}).get('type', 'Unknown')
+
+def filter_neighbors(neighbors, interface=None, bandwidth=None, min_bandwidth=None, device_type=None):
+    """
+    Applies the neighbor endpoint's filters. `interface` is a case-insensitive
+    substring of the local interface name, `bandwidth` an exact speed and
+    `min_bandwidth` a lower bound (both in any form `parse_bandwidth` accepts), and
+    `device_type` the neighbor's inventory type, e.g. 'Switch'.
+    Raises ValueError for an unparseable bandwidth.
+    """
+    exact = minimum = None
+    if bandwidth:
+        exact = parse_bandwidth(bandwidth)
+        if exact is None:
+            raise ValueError(f"Invalid bandwidth '{bandwidth}'")
+    if min_bandwidth:
+        minimum = parse_bandwidth(min_bandwidth)
+        if minimum is None:
+            raise ValueError(f"Invalid min_bandwidth '{min_bandwidth}'")
+    interface = interface.lower() if interface else None
+    device_type = device_type.lower() if device_type else None
+
+    filtered = []
+    for neighbor in neighbors:
+        if interface and interface not in neighbor.get('interface', '').lower():
+            continue
+        if exact is not None or minimum is not None:
+            speed = parse_bandwidth(neighbor.get('bandwidth'))
+            if speed is None or (exact is not None and speed != exact) or (minimum is not None and speed < minimum):
+                continue
+        if device_type and get_neighbor_device_type(neighbor).lower() != device_type:
+            continue
+        filtered.append(neighbor)
+    return filtered
+
+def _encode_neighbor_cursor(snapshot_id, offset):
+    return base64.urlsafe_b64encode(f"{snapshot_id}:{offset}".encode('ascii')).decode('ascii').rstrip('=')
+
+def _decode_neighbor_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        snapshot_id, offset = base64.urlsafe_b64decode(padded).decode('ascii').split(':')
+        return snapshot_id, int(offset)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+def _expire_neighbor_snapshots(now):
+    for snapshot_id, snapshot in list(_NEIGHBOR_SNAPSHOTS.items()):
+        if now - snapshot['created_at'] > NEIGHBOR_SNAPSHOT_TTL_SECONDS:
+            del _NEIGHBOR_SNAPSHOTS[snapshot_id]
+
+def get_device_neighbors_page(ip_address, limit=NEIGHBOR_PAGE_SIZE, cursor=None, filters=None):
+    """
+    Returns one page of a device's neighbors, after `filter_neighbors(**filters)`.
+
+    The first page (no cursor) walks the device and keeps the result as a short-lived
+    snapshot; `next_cursor` points into that snapshot, so following pages neither
+    re-poll the device nor shift if its adjacencies change mid-listing.
+    Returns None if the device is unknown or has no neighbors. Raises LookupError for
+    an expired cursor and ValueError for invalid arguments, including a cursor issued
+    for a different device.
+    """
+    limit = max(1, min(int(limit), NEIGHBOR_MAX_PAGE_SIZE))
+    now = time.time()
+
+    if cursor:
+        snapshot_id, offset = _decode_neighbor_cursor(cursor)
+        with _NEIGHBOR_SNAPSHOTS_LOCK:
+            _expire_neighbor_snapshots(now)
+            snapshot = _NEIGHBOR_SNAPSHOTS.get(snapshot_id)
+        if snapshot is None:
+            raise LookupError("Cursor has expired; restart the listing without a cursor")
+        if snapshot['ip'] != ip_address:
+            raise ValueError("Cursor belongs to a listing of another device")
+        neighbors = snapshot['neighbors']
+    else:
+        result = get_device_neighbors(ip_address)
+        if not result:
+            return None
+        neighbors = result['neighbors']
+        snapshot_id, offset = uuid.uuid4().hex, 0
+        with _NEIGHBOR_SNAPSHOTS_LOCK:
+            _expire_neighbor_snapshots(now)
+            _NEIGHBOR_SNAPSHOTS[snapshot_id] = {'ip': ip_address, 'neighbors': neighbors, 'created_at': now}
+
+    filtered = filter_neighbors(neighbors, **(filters or {}))
+    page = filtered[offset:offset + limit]
+    next_offset = offset + len(page)
+    return {
+        "neighbors": page,
+        "total": len(filtered),
+        "next_cursor": _encode_neighbor_cursor(snapshot_id, next_offset) if next_offset < len(filtered) else None
+    }
+
+def _point_config_at_background(config_content, background_path):
+    """Rewrites the BACKGROUND line of a .conf text to `background_path`."""
+    return re.sub(
         r'^(BACKGROUND\s+).*$', 
-        fr'\1{cacti_image_path}', 
+        fr'\1{background_path}', 
         config_content, 
         flags=re.MULTILINE
     )
 
-    # Save Config
-    config_filename = f"{map_name}_{unique_id}.conf"
-    config_path = os.path.join(configs_dir, config_filename)
-    with open(config_path, 'w') as f:
-        f.write(modified_config_content)
+def save_uploaded_map(map_image_file, config_content, map_name, generated_config=None):
+    """
+    Saves the uploaded map image and config file to the artifact store.
 
-    return {"image_path": image_path, "config_path": config_path}
+    If `generated_config` (from `config_generator.regenerate_config`) is given, the
+    config is assembled from it with the correct BACKGROUND path and `config_content`
+    is ignored; the returned paths then also include ready-to-render `map_data`.
+    """
+    # Handle both FileStorage and in-memory BytesIO objects
+    image_stream = getattr(map_image_file, 'stream', map_image_file)
+    image = Image.open(image_stream)
+    image_bytes = BytesIO()
+    image.save(image_bytes, 'PNG')
+    image_artifact = artifact_store.put_bytes(image_bytes.getvalue(), '.png', 'background')
+
+    # The config file needs to point to the *actual* image file we just saved,
+    # relative to the config's own location in the store.
+    cacti_image_path = artifact_store.reference_from_artifact(image_artifact)
+    map_data = None
+    if generated_config is not None:
+        modified_config_content = config_generator.assemble_config(generated_config, cacti_image_path)
+        map_data = dict(generated_config['map_data'], background=cacti_image_path)
+    else:
+        modified_config_content = _point_config_at_background(config_content, cacti_image_path)
+
+    config_artifact = artifact_store.put_bytes(modified_config_content.encode('utf-8'), '.conf', 'config')
+
+    return {
+        "image_path": image_artifact['path'],
+        "config_path": config_artifact['path'],
+        "map_data": map_data,
+        "artifacts": [image_artifact, config_artifact]
+    }
+
+def _store_preview(background, map_data):
+    """
+    Renders a map's preview and thumbnail from its background (a path or file object)
+    and stores both. Returns `([preview_artifact, thumbnail_artifact], preview_info)`.
+    """
+    preview_path = artifact_store.temp_path('.png')
+    thumbnail_path = artifact_store.temp_path('.png')
+    preview_info = map_renderer.render_and_save_preview(background, map_data, preview_path, thumbnail_path)
+
+    preview_artifact = artifact_store.put_file(preview_path, '.png', 'preview')
+    thumbnail_artifact = artifact_store.put_file(thumbnail_path, '.png', 'thumbnail')
+    return [preview_artifact, thumbnail_artifact], preview_info
+
+def render_task_preview(task_id, map_image_bytes, config_content, generated_config=None):
+    """
+    Renders the preview and thumbnail for a task, stores them, and exposes them on the
+    task record. A failed preview is logged but never fails the task itself.
+    Returns the stored preview artifact records.
+    """
+    try:
+        if generated_config is not None:
+            map_data = generated_config['map_data']
+        else:
+            map_data = map_renderer.parse_config(config_content)
+
+        artifacts, preview_info = _store_preview(map_image_bytes, map_data)
+        preview_artifact, thumbnail_artifact = artifacts
+        artifact_store.add_refs('task', task_id, artifacts)
+
+        MOCK_TASKS[task_id].update({
+            'preview_filename': preview_artifact['static_path'],
+            'thumbnail_filename': thumbnail_artifact['static_path'],
+            'preview_complete': preview_info['complete'],
+            'preview_seconds': preview_info['seconds'],
+            'updated_at': datetime.utcnow().isoformat()
+        })
+        return artifacts
+    except Exception as e:
+        print(f"Preview rendering failed for task {task_id}: {e}")
+        return []
 
-def process_map_task(task_id, map_image_bytes, config_content, map_name):
+def process_map_task(task_id, map_image_bytes, config_content, map_name, generated_config=None, deployment_id=None,
+                     encoder_profile=None, profile=False):
     """
     Simulates a long-running task to process and render a map.
     This function runs in a background thread.
+
+    Every artifact the task produces is referenced by the task; on success the set is
+    also referenced by `deployment_id` (installation + map), replacing whatever was
+    previously deployed there so the old artifacts can be garbage collected.
+
+    With `profile` set, the task runs under the sampling profiler and the task record
+    gets a `profile_id` for `/debug/profiles/<profile_id>`.
     """
+    args = (task_id, map_image_bytes, config_content, map_name, generated_config, deployment_id, encoder_profile)
+    if not profile:
+        _run_map_task(*args)
+        return
+
+    with profiler.profiled('task', task_id) as profile_record:
+        MOCK_TASKS[task_id]['profile_id'] = profile_record['id']
+        _run_map_task(*args)
+
+def _run_map_task(task_id, map_image_bytes, config_content, map_name, generated_config, deployment_id,
+                  encoder_profile):
+    encoder_profile = encoder_profile or encoder_profiles.DEFAULT_ENCODER_PROFILE
     try:
-        # Update task status to PROCESSING
+        # Step 1: Render a low-resolution preview straight from the upload so the user
+        # sees the map long before the full-resolution pipeline finishes.
+        MOCK_TASKS[task_id].update({
+            'status': 'PROCESSING',
+            'message': 'Rendering preview...',
+            'updated_at': datetime.utcnow().isoformat()
+        })
+        preview_artifacts = render_task_preview(task_id, map_image_bytes, config_content, generated_config)
+        map_image_bytes.seek(0)
+
         MOCK_TASKS[task_id].update({
             'status': 'PROCESSING',
             'message': 'Saving uploaded map components...',
@@ -414,9 +646,10 @@ def process_map_task(task_id, map_image_bytes, config_content, map_name):
         # Simulate some processing time
         time.sleep(2)
 
-        # Step 1: Save the uploaded background image and the modified .conf file
-        saved_paths = save_uploaded_map(map_image_bytes, config_content, map_name)
+        # Step 2: Save the uploaded background image and the modified .conf file
+        saved_paths = save_uploaded_map(map_image_bytes, config_content, map_name, generated_config)
         config_path = saved_paths['config_path']
+        artifact_store.add_refs('task', task_id, saved_paths['artifacts'])
         
         MOCK_TASKS[task_id].update({
             'status': 'PROCESSING',
@@ -427,20 +660,28 @@ def process_map_task(task_id, map_image_bytes, config_content, map_name):
         # Simulate more processing time
         time.sleep(3)
         
-        # Step 2: Define the output path for the final rendered map
-        config_filename = os.path.basename(config_path)
-        final_map_filename = config_filename.replace('.conf', '.png')
-        final_map_path = os.path.join('static/final_maps', final_map_filename)
+        # Step 3: Render the final map by drawing lines on the background into a scratch file
+        extension = encoder_profiles.get_encoder_profile(encoder_profile)['extension']
+        scratch_path = artifact_store.temp_path(extension)
+        render_farm.render_map(
+            saved_paths['artifacts'][0]['hash'], saved_paths['image_path'], config_path, scratch_path,
+            saved_paths['map_data'], encoder_profile
+        )
 
-        # Step 3: Render the final map by drawing lines on the background and save it
-        map_renderer.render_and_save_map(config_path, final_map_path)
+        # Step 4: Move the render into the artifact store and record who uses it
+        final_artifact = artifact_store.put_file(scratch_path, extension, 'final_map')
+        task_artifacts = saved_paths['artifacts'] + preview_artifacts + [final_artifact]
+        artifact_store.add_refs('task', task_id, [final_artifact])
+        if deployment_id:
+            artifact_store.replace_refs('deployment', deployment_id, task_artifacts)
+            change_detector.record_deployment(map_name, _config_device_ips(config_path))
         
-        # Step 4: Update task to SUCCESS
+        # Step 5: Update task to SUCCESS
         MOCK_TASKS[task_id].update({
             'status': 'SUCCESS',
             # The final URL will be constructed in the /task-status endpoint
             'message': 'Placeholder for final map URL.',
-            'final_map_filename': final_map_filename,
+            'final_map_filename': final_artifact['static_path'],
             'updated_at': datetime.utcnow().isoformat()
         })
 
@@ -450,4 +691,436 @@ def process_map_task(task_id, map_image_bytes, config_content, map_name):
             'status': 'FAILURE',
             'message': f'An internal error occurred: {e}',
             'updated_at': datetime.utcnow().isoformat()
-        })
\ No newline at end of file
+        })
+
+# --- Bulk Map Jobs ---
+
+def _entry_basename(info):
+    # Archive member names always use forward slashes, whatever the host OS.
+    return info.filename.rsplit('/', 1)[-1]
+
+def _read_archive_text(archive, info, max_bytes):
+    """Reads a small text entry from an archive, refusing anything over `max_bytes`."""
+    if info.file_size > max_bytes:
+        raise ValueError(f"{info.filename} is larger than {max_bytes} bytes")
+    with archive.open(info) as entry:
+        data = entry.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f"{info.filename} is larger than {max_bytes} bytes")
+    return data.decode('utf-8')
+
+def _find_bulk_background(config_content, map_name, images):
+    """
+    Picks the archive entry holding a config's background: the file named on its
+    BACKGROUND line if the archive has it, otherwise an image named after the map.
+    """
+    match = re.search(r'^BACKGROUND\s+(\S+)', config_content, flags=re.MULTILINE)
+    candidates = []
+    if match:
+        candidates.append(match.group(1).replace('\\', '/').rsplit('/', 1)[-1])
+    candidates.extend(f"{map_name}{extension}" for extension in BULK_IMAGE_EXTENSIONS)
+    for candidate in candidates:
+        if candidate in images:
+            return images[candidate]
+    return None
+
+def plan_bulk_archive(archive):
+    """
+    Pairs every `.conf` entry of an open bulk archive with its background entry.
+
+    Only the configs are read here (they are small); backgrounds stay in the archive
+    until they are streamed into the artifact store. Returns `(jobs, failures)`, where
+    each job holds the map name, its config text and the background's archive entry,
+    and each failure is a manifest entry for a config that cannot be rendered.
+    """
+    images = {}
+    configs = []
+    for info in archive.infolist():
+        name = _entry_basename(info)
+        # Skip directories and hidden files such as macOS `._` resource forks.
+        if info.is_dir() or not name or name.startswith('.'):
+            continue
+        extension = os.path.splitext(name)[1].lower()
+        if extension == '.conf':
+            configs.append(info)
+        elif extension in BULK_IMAGE_EXTENSIONS:
+            images.setdefault(name, info)
+
+    if not configs:
+        raise ValueError("The archive does not contain any .conf files")
+    if len(configs) > BULK_MAX_MAPS:
+        raise ValueError(f"The archive contains {len(configs)} maps; the limit is {BULK_MAX_MAPS}")
+
+    jobs = []
+    failures = []
+    map_names = set()
+    for info in configs:
+        map_name = os.path.splitext(_entry_basename(info))[0]
+        try:
+            if map_name in map_names:
+                raise ValueError(f"Duplicate map name '{map_name}'")
+            map_names.add(map_name)
+            config_content = _read_archive_text(archive, info, BULK_MAX_CONFIG_BYTES)
+            background_entry = _find_bulk_background(config_content, map_name, images)
+            if background_entry is None:
+                raise ValueError("No background image for this config was found in the archive")
+        except (ValueError, zipfile.BadZipFile) as e:
+            failures.append({'map_name': map_name, 'config_entry': info.filename, 'status': 'FAILURE', 'error': str(e)})
+            continue
+
+        jobs.append({
+            'map_name': map_name,
+            'config_entry': info.filename,
+            'config_content': config_content,
+            'background_entry': background_entry,
+        })
+    return jobs, failures
+
+def create_bulk_batch(batch_id, archive_bytes, encoder_profile):
+    """Registers a queued bulk job in MOCK_BATCHES with empty progress and report counters."""
+    batch = {
+        'id': batch_id,
+        'status': 'PENDING',
+        'message': 'Bulk map job has been queued.',
+        'encoder_profile': encoder_profile,
+        'total': 0,
+        'completed': 0,
+        'failed': 0,
+        'progress': 0,
+        'maps': [],
+        'report': {
+            'archive_bytes': archive_bytes,
+            'background_entries': 0,
+            'unique_backgrounds': 0,
+            'background_bytes_stored': 0,
+            'output_bytes': 0,
+            'elapsed_seconds': 0.0,
+            'maps_per_second': 0.0,
+            'bytes_per_second': 0,
+            'render_backend': render_farm.RENDER_BACKEND,
+            'render_workers': render_farm.RENDER_WORKERS,
+        },
+        'updated_at': datetime.utcnow().isoformat()
+    }
+    with _BATCHES_LOCK:
+        MOCK_BATCHES[batch_id] = batch
+    return batch
+
+def get_bulk_batch(batch_id):
+    """Returns a consistent snapshot of a bulk job record, or None if it does not exist."""
+    with _BATCHES_LOCK:
+        batch = MOCK_BATCHES.get(batch_id)
+        if batch is None:
+            return None
+        return dict(batch, maps=[dict(entry) for entry in batch['maps']], report=dict(batch['report']))
+
+def _record_bulk_result(batch, result, started):
+    """Adds one map's result to the batch manifest and refreshes progress and throughput."""
+    with _BATCHES_LOCK:
+        batch['maps'].append(result)
+        batch['completed' if result['status'] == 'SUCCESS' else 'failed'] += 1
+        done = batch['completed'] + batch['failed']
+        elapsed = time.perf_counter() - started
+
+        report = batch['report']
+        report['elapsed_seconds'] = round(elapsed, 3)
+        report['maps_per_second'] = round(batch['completed'] / elapsed, 3) if elapsed else 0.0
+        report['output_bytes'] += result.get('output_bytes', 0)
+        report['bytes_per_second'] = round(
+            (report['background_bytes_stored'] + report['output_bytes']) / elapsed
+        ) if elapsed else 0
+        batch.update({
+            'progress': round(100 * done / batch['total']) if batch['total'] else 100,
+            'message': f"Rendered {batch['completed']} of {batch['total']} maps ({batch['failed']} failed).",
+            'updated_at': datetime.utcnow().isoformat()
+        })
+
+def _render_bulk_map(batch_id, job, background, installations, encoder_profile):
+    """
+    Stores one map's config, renders it once and deploys the result to every
+    installation. Runs on the batch's render executor; returns its manifest entry.
+    """
+    started = time.perf_counter()
+    config_content = _point_config_at_background(
+        job['config_content'], artifact_store.reference_from_artifact(background)
+    )
+    config_artifact = artifact_store.put_bytes(config_content.encode('utf-8'), '.conf', 'config')
+
+    extension = encoder_profiles.get_encoder_profile(encoder_profile)['extension']
+    scratch_path = artifact_store.temp_path(extension)
+    render_result = render_farm.render_map(
+        background['hash'], background['path'], config_artifact['path'], scratch_path, None, encoder_profile
+    )
+    final_artifact = artifact_store.put_file(scratch_path, extension, 'final_map')
+
+    # Map lists show the thumbnail, so bulk-deployed maps get one like any other.
+    try:
+        preview_artifacts, _ = _store_preview(background['path'], map_renderer.parse_config(config_content))
+    except Exception as e:
+        print(f"Preview rendering failed for bulk map {job['map_name']}: {e}")
+        preview_artifacts = []
+
+    artifacts = [background, config_artifact, final_artifact] + preview_artifacts
+    artifact_store.add_refs('task', batch_id, artifacts)
+    for installation in installations:
+        artifact_store.replace_refs('deployment', f"{installation['hostname']}/{job['map_name']}", artifacts)
+    change_detector.record_deployment(job['map_name'], _config_device_ips(config_artifact['path']))
+
+    return {
+        'map_name': job['map_name'],
+        'config_entry': job['config_entry'],
+        'background_entry': job['background_entry'].filename,
+        'background_hash': background['hash'],
+        'status': 'SUCCESS',
+        'final_map_filename': final_artifact['static_path'],
+        'thumbnail_filename': preview_artifacts[1]['static_path'] if preview_artifacts else None,
+        'installations': [installation['hostname'] for installation in installations],
+        'backend': render_result['backend'],
+        'render_seconds': round(time.perf_counter() - started, 3),
+        'output_bytes': final_artifact['size'],
+    }
+
+def _run_bulk_renders(batch_id, archive, jobs, installations, encoder_profile, started):
+    """
+    Streams each distinct background out of the archive once and renders every map
+    that uses it. Only a bounded number of backgrounds are in flight at a time, so a
+    large archive never has all of its decoded backgrounds in memory together.
+    """
+    batch = MOCK_BATCHES[batch_id]
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job['background_entry'].filename, []).append(job)
+
+    use_shared_backgrounds = render_farm.RENDER_BACKEND == 'process'
+    in_flight = threading.BoundedSemaphore(max(2, render_farm.RENDER_WORKERS))
+    unique_backgrounds = set()
+
+    def fail_jobs(group_jobs, error):
+        for job in group_jobs:
+            _record_bulk_result(batch, {
+                'map_name': job['map_name'],
+                'config_entry': job['config_entry'],
+                'background_entry': job['background_entry'].filename,
+                'status': 'FAILURE',
+                'error': error,
+            }, started)
+
+    with ThreadPoolExecutor(max_workers=render_farm.RENDER_WORKERS) as executor:
+        for entry_name, group_jobs in groups.items():
+            in_flight.acquire()
+            entry = group_jobs[0]['background_entry']
+            try:
+                extension = os.path.splitext(entry_name)[1].lower()
+                with archive.open(entry) as stream:
+                    background = artifact_store.put_stream(stream, extension, 'background', BULK_MAX_BACKGROUND_BYTES)
+                if use_shared_backgrounds:
+                    # Hold the decode for the whole group so the map renders share it.
+                    render_farm.acquire_background(background['hash'], background['path'])
+            except Exception as e:
+                in_flight.release()
+                fail_jobs(group_jobs, f"Could not read background {entry_name}: {e}")
+                continue
+
+            with _BATCHES_LOCK:
+                batch['report']['background_entries'] += 1
+                if background['hash'] not in unique_backgrounds:
+                    unique_backgrounds.add(background['hash'])
+                    batch['report']['unique_backgrounds'] += 1
+                    batch['report']['background_bytes_stored'] += background['size']
+
+            remaining = [len(group_jobs)]
+
+            def on_done(future, job, background=background, remaining=remaining):
+                try:
+                    error = future.exception()
+                    if error is None:
+                        _record_bulk_result(batch, future.result(), started)
+                    else:
+                        fail_jobs([job], f"Rendering failed: {error}")
+                finally:
+                    with _BATCHES_LOCK:
+                        remaining[0] -= 1
+                        group_finished = remaining[0] == 0
+                    if group_finished:
+                        if use_shared_backgrounds:
+                            render_farm.release_background(background['hash'])
+                        in_flight.release()
+
+            for job in group_jobs:
+                future = executor.submit(_render_bulk_map, batch_id, job, background, installations, encoder_profile)
+                future.add_done_callback(lambda f, job=job: on_done(f, job))
+
+def process_bulk_job(batch_id, archive_path, installations, encoder_profile=None):
+    """
+    Renders every map in a bulk archive and deploys each one to all installations of
+    the group. This function runs in a background thread.
+
+    The archive is read entry by entry and never extracted. Backgrounds are stored by
+    content hash, so one shared by many maps is written (and, with the process render
+    backend, decoded) once. Each map is rendered once for the whole group, not once per
+    installation. Progress, a per-map manifest and a throughput report are kept on the
+    batch record in MOCK_BATCHES.
+    """
+    batch = MOCK_BATCHES[batch_id]
+    encoder_profile = encoder_profile or encoder_profiles.DEFAULT_ENCODER_PROFILE
+    started = time.perf_counter()
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            jobs, failures = plan_bulk_archive(archive)
+            with _BATCHES_LOCK:
+                batch.update({
+                    'status': 'PROCESSING',
+                    'total': len(jobs) + len(failures),
+                    'message': f"Rendering {len(jobs)} maps...",
+                    'updated_at': datetime.utcnow().isoformat()
+                })
+            for failure in failures:
+                _record_bulk_result(batch, failure, started)
+
+            _run_bulk_renders(batch_id, archive, jobs, installations, encoder_profile, started)
+
+        with _BATCHES_LOCK:
+            batch['maps'].sort(key=lambda entry: entry['map_name'])
+            if batch['failed'] == 0:
+                status = 'SUCCESS'
+            elif batch['completed'] == 0:
+                status = 'FAILURE'
+            else:
+                status = 'PARTIAL_SUCCESS'
+            batch.update({
+                'status': status,
+                'message': f"Rendered {batch['completed']} of {batch['total']} maps ({batch['failed']} failed).",
+                'updated_at': datetime.utcnow().isoformat()
+            })
+        print(f"Batch {batch_id} finished: {batch['report']}")
+
+    except Exception as e:
+        print(f"Error during bulk processing for batch {batch_id}: {e}")
+        with _BATCHES_LOCK:
+            batch.update({
+                'status': 'FAILURE',
+                'message': f'An internal error occurred: {e}',
+                'updated_at': datetime.utcnow().isoformat()
+            })
+    finally:
+        os.remove(archive_path)
+
+
+# --- Topology Change Detection ---
+
+@lru_cache(maxsize=4096)
+def _config_device_ips(config_path):
+    """
+    Device IPs referenced by a stored config: link sources from DEVICE lines and, for
+    server-generated configs, every drawn device from its `autocacti_sublabel`.
+    Stored configs are content-addressed and never change, so the path is a safe key.
+    """
+    with open(config_path, encoding='utf-8') as f:
+        config_content = f.read()
+    ips = set(re.findall(r'^\s+DEVICE\s+\S+\s+(\S+)\s*$', config_content, flags=re.MULTILINE))
+    ips.update(re.findall(r'^\s+SET\s+autocacti_sublabel\s+(\S+)\s*$', config_content, flags=re.MULTILINE))
+    ips.discard('None')
+    return frozenset(ips)
+
+@lru_cache(maxsize=256)
+def _config_blocks(config_path):
+    # Stored configs are content-addressed, so the path is a safe (and bounded) cache key.
+    with open(config_path, encoding='utf-8') as f:
+        return config_generator.parse_blocks(f.read())
+
+def get_deployed_config_blocks(map_name):
+    """
+    Returns the NODE/LINK blocks of the config most recently deployed for `map_name`
+    (on any installation), or an empty dict if the map was never deployed. Read from
+    the artifact index, so every worker compares against the same baseline.
+    """
+    latest = artifact_store.latest_owner_artifact('deployment', 'config', owner_suffix=f"/{map_name}")
+    if latest is None:
+        return {}
+    try:
+        return _config_blocks(latest['path'])
+    except OSError as e:
+        print(f"Could not read deployed config for {map_name}: {e}")
+        return {}
+
+def get_deployed_map_devices():
+    """Returns `{map_name: device IPs}` across every installation the map is deployed to."""
+    maps = {}
+    for deployment_id, artifacts in artifact_store.list_owner_artifacts('deployment').items():
+        config = artifacts.get('config')
+        if not config:
+            continue
+        _, _, map_name = deployment_id.partition('/')
+        try:
+            maps.setdefault(map_name, set()).update(_config_device_ips(config['path']))
+        except OSError as e:
+            print(f"Could not read deployed config for {deployment_id}: {e}")
+    return maps
+
+def remove_stale_links(config_content, changes):
+    """
+    Drops LINK blocks whose source device changed and no longer reports a neighbor on
+    the link's interface. Returns `(config_content, removed_link_names)`.
+    New adjacencies are not added: placing them is an editing decision.
+    """
+    current_interfaces = {
+        ip: {neighbor.get('interface') for neighbor in change['neighbors']} for ip, change in changes.items()
+    }
+    lines = config_content.split('\n')
+    kept = []
+    removed = []
+    i = 0
+    while i < len(lines):
+        if not lines[i].startswith('LINK '):
+            kept.append(lines[i])
+            i += 1
+            continue
+        end = i + 1
+        while end < len(lines) and lines[end][:1] in ('\t', ' ') and lines[end].strip():
+            end += 1
+        block = lines[i:end]
+        device = re.search(r'^\s+DEVICE\s+\S+\s+(\S+)', '\n'.join(block), flags=re.MULTILINE)
+        interface = re.search(r'^\s+INTERFACE\s+(.+?)\s*$', '\n'.join(block), flags=re.MULTILINE)
+        if device and interface and device.group(1) in current_interfaces \
+                and interface.group(1) not in current_interfaces[device.group(1)]:
+            removed.append(block[0].split()[1])
+            # Drop the blank line that separated this block from the next one.
+            if end < len(lines) and not lines[end].strip():
+                end += 1
+        else:
+            kept.extend(block)
+        i = end
+    return '\n'.join(kept), removed
+
+def rerender_stale_map(map_name, changes):
+    """
+    Change-detection hook: re-renders each deployment of `map_name` without the links
+    that disappeared, reusing the deployed background, and redeploys the result.
+    Deployments that have no such links are left alone. The map keeps its deployed
+    baseline and stays stale, since new adjacencies still need to be placed by hand.
+    """
+    for deployment_id, artifacts in artifact_store.list_owner_artifacts('deployment').items():
+        if deployment_id.partition('/')[2] != map_name or 'config' not in artifacts or 'background' not in artifacts:
+            continue
+        with open(artifacts['config']['path'], encoding='utf-8') as f:
+            config_content, removed = remove_stale_links(f.read(), changes)
+        if not removed:
+            continue
+
+        config_artifact = artifact_store.put_bytes(config_content.encode('utf-8'), '.conf', 'config')
+        encoder_profile = get_installation_encoder_profile(deployment_id.partition('/')[0])
+        final_extension = encoder_profiles.get_encoder_profile(encoder_profile)['extension']
+        scratch_path = artifact_store.temp_path(final_extension)
+        background = artifacts['background']
+        render_farm.render_map(background['hash'], background['path'], config_artifact['path'], scratch_path,
+                               None, encoder_profile)
+        final_artifact = artifact_store.put_file(scratch_path, final_extension, 'final_map')
+        # The old preview and thumbnail still show the removed links, so they are redrawn.
+        try:
+            preview_artifacts, _ = _store_preview(background['path'], map_renderer.parse_config(config_content))
+        except Exception as e:
+            print(f"Preview rendering failed for {deployment_id}: {e}")
+            preview_artifacts = []
+        artifact_store.replace_refs('deployment', deployment_id,
+                                    [background, config_artifact, final_artifact] + preview_artifacts)
+        print(f"Re-rendered {deployment_id} without stale links {removed}")
@@ -0,0 +1,4 @@
+# Entry point for WSGI servers, e.g. `gunicorn wsgi:app` or `flask --app wsgi run`.
+from app import create_app
+
+app = create_app()
@@ -1,7 +1,6 @@
 // frontend/src/services/mapExportService.js
 import { toBlob } from 'html-to-image';
-import { generateCactiConfig } from './configGenerator';
-import { createMap, getConfigTemplate } from './apiService';
+import { createMap } from './apiService';
 import { ICONS_BY_THEME, NODE_WIDTH, NODE_HEIGHT } from '../config/constants';
 
 /**
@@ -114,17 +113,18 @@ export const exportAndUploadMap = async ({ mapElement, nodes, edges, mapName, ca
             width: width,
             height: height,
             backgroundColor: backgroundColor,
-            filter: (node) => (node.className !== 'react-flow__controls'),
+            // Device nodes are drawn by the backend from the map document, so leaving them
+            // out of the captured background keeps the upload small.
+            filter: (node) => (
+                node.className !== 'react-flow__controls' &&
+                !node.classList?.contains('react-flow__node-custom')
+            ),
         });
 
         if (!blob) {
             throw new Error('Failed to create image blob.');
         }
         
-        // Fetch the configuration template from the backend.
-        const templateResponse = await getConfigTemplate();
-        const configTemplate = templateResponse.data;
-
         // Calculate the offsets needed to center the content in the final image.
         const contentWidth = (nodes.reduce((max, n) => Math.max(max, n.position.x + (n.type === 'group' ? n.data.width : NODE_WIDTH)), 0) - minX);
         const contentHeight = (nodes.reduce((max, n) => Math.max(max, n.position.y + (n.type === 'group' ? n.data.height : NODE_HEIGHT)), 0) - minY);
@@ -141,19 +141,21 @@ export const exportAndUploadMap = async ({ mapElement, nodes, edges, mapName, ca
             },
         }));
         
-        const configContent = generateCactiConfig({
-            nodes: nodesForConfig, 
-            edges, 
-            mapName, 
-            mapWidth: width, 
-            mapHeight: height,
+        // Send the structured map document; the backend generates the Weathermap config
+        // from it directly, which also lets it regenerate only the blocks that changed.
+        const mapDocument = {
+            nodes: nodesForConfig,
+            edges,
+            width,
+            height,
             scaleFactor,
-            configTemplate, // Pass the fetched template
-        });
-        
+            renderNodes: true,
+            theme,
+        };
+
         const formData = new FormData();
         formData.append('map_image', blob, `${mapName}.png`);
-        formData.append('config_content', configContent);
+        formData.append('map_document', JSON.stringify(mapDocument));
         formData.append('map_name', mapName);
         formData.append('cacti_group_id', cactiGroupId);
 